@@ -15,5 +15,13 @@ def get_node_mappings():
 # ComfyUI会调用这两个变量
 NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS = get_node_mappings()
 
+# 在服务端注册预取处理函数 (需在 config.json 中开启 "async": {"prefetch": true})
+from .async_runtime import install_prefetch_hook
+install_prefetch_hook(NODE_CLASS_MAPPINGS)
+
+# 注册 /ai_prompt_tools/metrics 接口，以 Prometheus 文本格式输出汇总指标
+from .metrics import install_metrics_route
+install_metrics_route()
+
 # 声明这个包对外暴露了哪些变量
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
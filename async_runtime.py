@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import sys
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import get_config_section
+
+# 后台事件循环使用的线程数，决定同时进行的网络请求上限
+DEFAULT_ASYNC_SETTINGS = {"workers": 8, "prefetch": False}
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_async_settings() -> dict:
+    settings = dict(DEFAULT_ASYNC_SETTINGS)
+    section = get_config_section("async")
+    if isinstance(section, dict):
+        settings.update(section)
+    return settings
+
+
+def async_nodes_supported() -> bool:
+    """新版ComfyUI支持 async 节点函数，多个节点的等待可以并行；旧版本仍使用同步函数"""
+    execution = sys.modules.get("execution")
+    return execution is not None and hasattr(execution, "_async_map_node_over_list")
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """首次使用时启动后台事件循环线程，阻塞的网络调用在其线程池中执行"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(
+                max_workers=int(get_async_settings()["workers"]), thread_name_prefix="ai-prompt-io"))
+            threading.Thread(target=loop.run_forever, name="ai-prompt-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def submit(fn, *args, **kwargs):
+    """把阻塞调用提交到后台事件循环，返回 concurrent.futures.Future"""
+    loop = _get_loop()
+
+    async def runner():
+        return await loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+
+    return asyncio.run_coroutine_threadsafe(runner(), loop)
+
+
+async def run_in_background(fn, *args, **kwargs):
+    """在ComfyUI的事件循环中等待后台执行结果，不阻塞其他节点"""
+    return await asyncio.wrap_future(submit(fn, *args, **kwargs))
+
+
+def select_function(sync_name: str, async_name: str) -> str:
+    return async_name if async_nodes_supported() else sync_name
+
+
+# --- 预取: 提交到队列的工作流中，输入全部是常量的节点会被提前执行以预热缓存 ---
+
+def _is_literal(value) -> bool:
+    # API 格式中，连接到其他节点的输入是 [节点ID, 输出序号]
+    return not (isinstance(value, list) and len(value) == 2 and isinstance(value[1], int))
+
+
+def _prefetch(node_class, function_name: str, inputs: dict) -> None:
+    try:
+        getattr(node_class(), function_name)(**inputs)
+    except Exception as e:
+        print(f"⚠️ 预取失败: {e}")
+
+
+def make_prefetch_handler(node_classes: dict):
+    """
+    返回一个 on_prompt 处理函数：在工作流进入队列时，
+    为输入全部确定、且不含图片的节点在后台提前发起请求，结果写入本地缓存。
+    """
+    def handler(json_data):
+        try:
+            if not get_async_settings()["prefetch"]:
+                return json_data
+            for node in (json_data.get("prompt") or {}).values():
+                node_class = node_classes.get(node.get("class_type"))
+                inputs = node.get("inputs", {})
+                prefetch_function = getattr(node_class, "PREFETCH_FUNCTION", None)
+                if prefetch_function is None or inputs.get("bypass_cache"):
+                    continue
+                if "image" in inputs or not all(_is_literal(value) for value in inputs.values()):
+                    continue
+                print(f"⏩ 预取节点 {node.get('class_type')} 的结果。")
+                submit(_prefetch, node_class, prefetch_function, dict(inputs))
+        except Exception as e:
+            print(f"⚠️ 预取处理失败: {e}")
+        return json_data
+
+    return handler
+
+
+def install_prefetch_hook(node_classes: dict) -> None:
+    """在ComfyUI服务端注册预取处理函数；非ComfyUI环境下直接跳过"""
+    try:
+        from server import PromptServer
+        PromptServer.instance.add_on_prompt_handler(make_prefetch_handler(node_classes))
+    except Exception:
+        pass
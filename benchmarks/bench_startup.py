@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准：在全新的Python进程中加载插件并注册节点，
+统计导入耗时、首次调用 INPUT_TYPES 的耗时，以及是否加载了 torch / PIL / numpy / requests 等重量级依赖。
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --importtime   # 额外输出 python -X importtime 中最慢的模块
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(BENCH_DIR)
+HEAVY_MODULES = ["torch", "numpy", "PIL", "requests", "urllib3"]
+
+# 在子进程中执行：每次都是冷启动，不受本进程已导入模块的影响
+PROBE = r"""
+import sys, json, time, importlib.util
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("ai_prompt_refiner", {init!r}, submodule_search_locations=[{plugin!r}])
+module = importlib.util.module_from_spec(spec)
+sys.modules["ai_prompt_refiner"] = module
+spec.loader.exec_module(module)
+import_seconds = time.perf_counter() - start
+start = time.perf_counter()
+for node_class in module.NODE_CLASS_MAPPINGS.values():
+    node_class.INPUT_TYPES()
+input_types_seconds = time.perf_counter() - start
+print(json.dumps({{
+    "import_ms": import_seconds * 1000,
+    "input_types_ms": input_types_seconds * 1000,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def run_probe() -> dict:
+    code = PROBE.format(init=os.path.join(PLUGIN_DIR, "__init__.py"), plugin=PLUGIN_DIR, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=PLUGIN_DIR)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    # 插件自身的日志也会输出到 stdout，结果在最后一行
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def interpreter_baseline_ms(runs: int) -> float:
+    """空解释器的启动耗时，用于和插件的导入耗时对照"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def slowest_imports(top: int) -> list:
+    """用 -X importtime 统计插件导入过程中累计耗时最长的模块"""
+    code = PROBE.format(init=os.path.join(PLUGIN_DIR, "__init__.py"), plugin=PLUGIN_DIR, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, cwd=PLUGIN_DIR)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line.split(":", 1)[1].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI提示词插件启动耗时基准")
+    parser.add_argument("--runs", type=int, default=5, help="冷启动次数")
+    parser.add_argument("--importtime", action="store_true", help="输出导入最慢的模块")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", dest="json_path", help="把结果另存为JSON文件")
+    args = parser.parse_args()
+
+    samples = [run_probe() for _ in range(args.runs)]
+    import_ms = [s["import_ms"] for s in samples]
+    input_types_ms = [s["input_types_ms"] for s in samples]
+    summary = {
+        "runs": args.runs,
+        "interpreter_ms": interpreter_baseline_ms(args.runs),
+        "import_ms_median": statistics.median(import_ms),
+        "import_ms_max": max(import_ms),
+        "input_types_ms_median": statistics.median(input_types_ms),
+        "heavy_modules_loaded": samples[-1]["loaded"],
+    }
+
+    print(f"冷启动次数:           {summary['runs']}")
+    print(f"空解释器启动 (中位数): {summary['interpreter_ms']:.1f} ms")
+    print(f"插件导入 (中位数/最大): {summary['import_ms_median']:.1f} / {summary['import_ms_max']:.1f} ms")
+    print(f"INPUT_TYPES (中位数):  {summary['input_types_ms_median']:.2f} ms")
+    print(f"已加载的重量级依赖:    {', '.join(summary['heavy_modules_loaded']) or '无'}")
+
+    if args.importtime:
+        print(f"\n{'cumulative us':>14}{'self us':>10}  module")
+        for cumulative_us, self_us, name in slowest_imports(args.top):
+            print(f"{cumulative_us:>14}{self_us:>10}  {name}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟服务，用于离线基准测试。
+支持 OpenAI chat-completions、Gemini generateContent / streamGenerateContent、
+Google translate_a/single 和 MyMemory 四种接口格式，可配置延迟、错误率(可附带 Retry-After)和流式分块。
+
+单独运行: python mock_server.py --port 18080 --latency 0.2 --error-rate 0.05
+"""
+import json
+import time
+import random
+import sys
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+MOCK_PROMPT = "a cute cat sitting on a windowsill, soft morning light, highly detailed fur, photographic"
+MOCK_NOTES = "优化说明：补充了光线、材质和构图细节，使画面更加具体。" * 4
+MOCK_CONTENT = f"[EN] {MOCK_PROMPT} [ZH] {MOCK_NOTES}"
+
+
+class MockSettings:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, chunk_size: int = 16, chunk_delay: float = 0.0, retry_after: float = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.retry_after = retry_after
+
+
+class MockStats:
+    """记录请求次数和收发字节数，基准脚本通过 /__stats 读取"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.bytes_received = 0
+            self.bytes_sent = 0
+
+    def record(self, received: int, sent: int, error: bool = False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors,
+                    "bytes_received": self.bytes_received, "bytes_sent": self.bytes_sent}
+
+
+def _chunks(text: str, size: int):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    settings = MockSettings()
+    stats = MockStats()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _request_size(self, body: bytes) -> int:
+        return len(self.requestline) + len(str(self.headers)) + len(body)
+
+    def _send_json(self, data, received: int, status: int = 200, headers: dict = None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.stats.record(received, len(body), error=status >= 400)
+
+    def _send_sse(self, events, received: int):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        try:
+            for event in events:
+                data = f"data: {event}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+                sent += len(data)
+                if self.settings.chunk_delay:
+                    time.sleep(self.settings.chunk_delay)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端在提取到 [EN] 后提前断开
+            self.close_connection = True
+        self.stats.record(received, sent)
+
+    def _simulate(self, received: int) -> bool:
+        """模拟延迟和错误；返回 False 表示已经发送了错误响应"""
+        delay = self.settings.latency + random.uniform(0, self.settings.jitter)
+        if delay:
+            time.sleep(delay)
+        if self.settings.error_rate and random.random() < self.settings.error_rate:
+            headers = {"Retry-After": f"{self.settings.retry_after:g}"} if self.settings.retry_after is not None else None
+            self._send_json({"error": {"message": "mock error"}}, received, status=self.settings.error_status, headers=headers)
+            return False
+        return True
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        received = self._request_size(b"")
+        if parts.path == "/__stats":
+            return self._send_json(self.stats.as_dict(), 0)
+        if parts.path == "/__reset":
+            self.stats.reset()
+            return self._send_json({"ok": True}, 0)
+        if not self._simulate(received):
+            return
+        if parts.path == "/translate_a/single":
+            # 与真实接口一致，每一行的译文保留原文中的换行符
+            lines = query.get("q", [""])[0].split("\n")
+            items = [[f"T({line})" + ("\n" if i < len(lines) - 1 else ""), line, None, None] for i, line in enumerate(lines)]
+            return self._send_json([items], received)
+        if parts.path == "/get":
+            text = query.get("q", [""])[0]
+            return self._send_json({"responseStatus": 200, "responseData": {"translatedText": f"T({text})"}}, received)
+        self._send_json({"error": "not found"}, received, status=404)
+
+    def do_POST(self):
+        body = self._read_body()
+        received = self._request_size(body)
+        parts = urlsplit(self.path)
+        if not self._simulate(received):
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return self._send_json({"error": "invalid json"}, received, status=400)
+
+        if parts.path.endswith("/chat/completions"):
+            content = self._chat_content(payload)
+            usage = {"prompt_tokens": len(body) // 4, "completion_tokens": len(content) // 4}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            if payload.get("stream"):
+                events = [json.dumps({"choices": [{"delta": {"content": chunk}}]}, ensure_ascii=False)
+                          for chunk in _chunks(content, self.settings.chunk_size)]
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    # 与 OpenAI 一致，用量在 choices 为空的最后一个事件中返回
+                    events.append(json.dumps({"choices": [], "usage": usage}))
+                return self._send_sse(events + ["[DONE]"], received)
+            return self._send_json({"choices": [{"message": {"role": "assistant", "content": content}}], "usage": usage}, received)
+
+        usage = {"promptTokenCount": len(body) // 4, "candidatesTokenCount": len(MOCK_CONTENT) // 4}
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+        if ":streamGenerateContent" in parts.path:
+            # 与 Gemini 一致，每个事件都带有截至当前的累计 usageMetadata
+            events, generated = [], 0
+            for chunk in _chunks(MOCK_CONTENT, self.settings.chunk_size):
+                generated += len(chunk)
+                partial = {**usage, "candidatesTokenCount": generated // 4, "totalTokenCount": usage["promptTokenCount"] + generated // 4}
+                events.append(json.dumps({"candidates": [{"content": {"parts": [{"text": chunk}]}}], "usageMetadata": partial}, ensure_ascii=False))
+            return self._send_sse(events, received)
+        if ":generateContent" in parts.path:
+            return self._send_json({"candidates": [{"content": {"parts": [{"text": MOCK_CONTENT}]}}], "usageMetadata": usage}, received)
+
+        self._send_json({"error": "not found"}, received, status=404)
+
+    def _chat_content(self, payload: dict) -> str:
+        messages = payload.get("messages") or [{}]
+        system = str(messages[0].get("content", ""))
+        if "professional translator" in system:
+            # 翻译请求按行返回，保持行数一致
+            text = messages[-1].get("content", "")
+            return "\n".join(f"T({line})" for line in str(text).split("\n"))
+        return MOCK_CONTENT
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # 流式“仅提示词”场景中客户端会主动断开，读取下一个请求时的连接重置属于正常情况
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_server(port: int = 0, settings: MockSettings = None):
+    """在后台线程启动模拟服务，返回 (server, base_url)"""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"settings": settings or MockSettings(), "stats": MockStats()})
+    server = MockHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def serve(port: int, settings: MockSettings, ready=None):
+    """在子进程中运行，使模拟服务的CPU开销不计入基准结果"""
+    server, _ = start_server(port, settings)
+    if ready is not None:
+        ready.send(server.server_address[1])
+    threading.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线模拟 LLM / 翻译服务")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外的随机延迟上限(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的概率 (0~1)")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--chunk-size", type=int, default=16, help="流式响应每个事件的字符数")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="流式响应事件之间的间隔(秒)")
+    parser.add_argument("--retry-after", type=float, default=None, help="错误响应附带的 Retry-After 秒数")
+    args = parser.parse_args()
+    settings = MockSettings(args.latency, args.jitter, args.error_rate, args.error_status, args.chunk_size, args.chunk_delay,
+                            args.retry_after)
+    server, base_url = start_server(args.port, settings)
+    print(f"🧪 模拟服务已启动: {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
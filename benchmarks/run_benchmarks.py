@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+离线基准测试：启动本地模拟服务，驱动 AIPromptRefiner / AIPromptBatchRefiner / AITranslator，
+统计每个场景的 p50/p95/p99 延迟、每秒请求数、上传字节数和每次调用的CPU时间。
+
+需要在安装了插件依赖(torch、numpy、Pillow、requests)的环境中运行，例如ComfyUI的Python环境:
+    python benchmarks/run_benchmarks.py --requests 50 --latency 0.05
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import importlib.util
+import multiprocessing
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_server import MockSettings, serve  # noqa: E402
+
+SCENARIOS = ["text_chatgpt", "text_gemini", "stream_prompt_only", "vision", "batch",
+             "translate_google", "translate_mymemory", "translate_ai", "cached"]
+
+
+def load_plugin(name: str = "ai_prompt_refiner"):
+    """插件目录名可能包含连字符，按文件路径加载为一个包"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(PLUGIN_DIR, "__init__.py"),
+                                                  submodule_search_locations=[PLUGIN_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def start_mock_server(settings: MockSettings):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(0, settings, child), daemon=True)
+    process.start()
+    port = parent.recv()
+    return process, f"http://127.0.0.1:{port}"
+
+
+def server_stats(base_url: str, reset: bool = False) -> dict:
+    with urllib.request.urlopen(f"{base_url}/{'__reset' if reset else '__stats'}") as response:
+        return json.loads(response.read())
+
+
+def write_config(path: str, base_url: str, concurrency: int) -> None:
+    config = {
+        "configurations": [
+            {"name": "Mock ChatGPT", "type": "ChatGPT", "api_key": "mock", "model": "mock-gpt",
+             "api_base": f"{base_url}/v1/chat/completions", "batch": {"concurrency": concurrency}},
+            {"name": "Mock Gemini", "type": "Gemini", "api_key": "mock", "model": "mock-gemini",
+             "api_base": f"{base_url}/v1beta/models/mock-gemini:generateContent"},
+        ],
+        # 基准测试衡量插件自身的开销，关闭免费翻译接口的默认限速
+        "rate_limits": {"Google Translate": {"rpm": 0}, "MyMemory Translate": {"rpm": 0}},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False)
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def build_scenarios(plugin, args):
+    refiner = plugin.NODE_CLASS_MAPPINGS["AIPromptRefiner"]()
+    batch_refiner = plugin.NODE_CLASS_MAPPINGS["AIPromptBatchRefiner"]()
+    translator = plugin.NODE_CLASS_MAPPINGS["AITranslator"]()
+    base = dict(target_model="Flux", strict_mode=True, style="摄影", detail_level="详细",
+                negative_mode="基础模板", custom_negative="")
+
+    def refine(config, stream_mode="关闭"):
+        def run(i):
+            result = refiner.refine_prompt(f"a cute cat #{i}", config, bypass_cache=True, stream_mode=stream_mode, **base)
+            return 0 if not result[2].startswith("❌") else 1
+        return run
+
+    def vision(i):
+        import torch
+        image = torch.rand(1, args.image_size, args.image_size, 3)
+        result = refiner.refine_prompt(f"variation #{i}", "Mock ChatGPT", image=image, bypass_cache=True, **base)
+        return 0 if not result[2].startswith("❌") else 1
+
+    def batch(i):
+        prompts = "\n".join(f"batch {i} item {j}" for j in range(args.batch_size))
+        results = batch_refiner.refine_batch(prompts, "Mock ChatGPT", bypass_cache=True, **base)
+        return sum(1 for notes in results[2] if notes.startswith("❌"))
+
+    def translate(service):
+        def run(i):
+            # 每次使用不同的片段，避免翻译记忆库命中
+            text = f"一只可爱的猫{i}，坐在窗台上{i}，柔和的晨光{i}"
+            result = translator.translate(text, "中文 -> 英文", service)
+            return 1 if result[0].startswith("错误") else 0
+        return run
+
+    def cached(i):
+        result = refiner.refine_prompt("a cached cat", "Mock ChatGPT", bypass_cache=False, **base)
+        return 0 if not result[2].startswith("❌") else 1
+
+    return {
+        "text_chatgpt": (refine("Mock ChatGPT"), 1),
+        "text_gemini": (refine("Mock Gemini"), 1),
+        "stream_prompt_only": (refine("Mock ChatGPT", stream_mode="流式(仅提示词)"), 1),
+        "vision": (vision, 1),
+        "batch": (batch, args.batch_size),
+        "translate_google": (translate("Google Translate"), 1),
+        "translate_mymemory": (translate("MyMemory Translate"), 1),
+        "translate_ai": (translate("Mock ChatGPT"), 1),
+        "cached": (cached, 1),
+    }
+
+
+def run_scenario(name: str, fn, items_per_call: int, base_url: str, requests_count: int) -> dict:
+    fn(-1)  # 预热: 建立连接、编译模板
+    server_stats(base_url, reset=True)
+    latencies, errors = [], 0
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for i in range(requests_count):
+        start = time.perf_counter()
+        errors += fn(i)
+        latencies.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    stats = server_stats(base_url)
+    items = requests_count * items_per_call
+    return {
+        "scenario": name,
+        "calls": requests_count,
+        "items": items,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "items_per_sec": items / wall if wall else 0.0,
+        "bytes_sent_per_item": stats["bytes_received"] / items if items else 0,
+        "bytes_received_per_item": stats["bytes_sent"] / items if items else 0,
+        "cpu_ms_per_item": cpu * 1000 / items if items else 0.0,
+        "upstream_requests": stats["requests"],
+    }
+
+
+def print_table(results) -> None:
+    header = f"{'scenario':<20}{'items':>7}{'err':>5}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'items/s':>9}{'sentB':>9}{'cpu ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<20}{r['items']:>7}{r['errors']:>5}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['items_per_sec']:>9.1f}{r['bytes_sent_per_item']:>9.0f}{r['cpu_ms_per_item']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI提示词插件离线基准测试")
+    parser.add_argument("--requests", type=int, default=20, help="每个场景的调用次数")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟服务的固定延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503, help="模拟错误的状态码，例如 429")
+    parser.add_argument("--retry-after", type=float, default=None, help="错误响应附带的 Retry-After 秒数")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="流式响应事件间隔(秒)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4, help="批量场景的并发数")
+    parser.add_argument("--image-size", type=int, default=1536, help="视觉场景的图片边长")
+    parser.add_argument("--json", dest="json_path", help="把结果另存为JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示节点自身的日志输出")
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency, args.jitter, args.error_rate, args.error_status,
+                            chunk_delay=args.chunk_delay, retry_after=args.retry_after)
+    process, base_url = start_mock_server(settings)
+    work_dir = tempfile.mkdtemp(prefix="ai-prompt-bench-")
+    try:
+        plugin = load_plugin()
+        common, cache = sys.modules["ai_prompt_refiner.common"], sys.modules["ai_prompt_refiner.cache"]
+        common.CONFIG_PATH = os.path.join(work_dir, "config.json")
+        write_config(common.CONFIG_PATH, base_url, args.concurrency)
+        cache.response_cache.path = os.path.join(work_dir, "responses.sqlite3")
+        cache.translation_memory.path = os.path.join(work_dir, "translations.sqlite3")
+        translator_class = plugin.NODE_CLASS_MAPPINGS["AITranslator"]
+        translator_class.GOOGLE_TRANSLATE_URL = f"{base_url}/translate_a/single"
+        translator_class.MYMEMORY_URL = f"{base_url}/get"
+
+        scenarios = build_scenarios(plugin, args)
+        results = []
+        for name in args.scenarios:
+            fn, items_per_call = scenarios[name]
+            stdout = sys.stdout
+            if not args.verbose:
+                sys.stdout = open(os.devnull, "w")
+            try:
+                results.append(run_scenario(name, fn, items_per_call, base_url, args.requests))
+            finally:
+                if sys.stdout is not stdout:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+        print_table(results)
+        if args.json_path:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        process.terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
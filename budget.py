@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from .common import estimate_tokens
+
+# 默认的 token 预算，可在预设的 "budget" 字段中覆盖；设为 0 表示不限制
+DEFAULT_BUDGET_SETTINGS = {
+    "max_output_tokens": 1024,          # 文本模式的输出上限
+    "vision_max_output_tokens": 2048,   # 图生文模式的输出上限
+    "en_only_max_output_tokens": 400,   # “仅提示词”模式的输出上限
+    "max_prompt_tokens": 2000,          # 用户提示词的长度上限
+    "max_input_tokens": 8000,           # 整个请求的估算输入上限
+    "oversize_action": "truncate",      # 提示词超长时: "truncate" 截断 或 "reject" 拒绝
+    "gemini_output_cap": False,         # 是否为 Gemini 写入 maxOutputTokens；思考模型的思考 token 也计入该上限
+}
+
+# 每张图片按 OpenAI 高清模式 1024px 的大致消耗估算
+IMAGE_TOKEN_ESTIMATE = 765
+
+
+def get_budget_settings(config: dict) -> dict:
+    settings = dict(DEFAULT_BUDGET_SETTINGS)
+    if isinstance(config.get("budget"), dict):
+        settings.update(config["budget"])
+    return settings
+
+
+def truncate_to_tokens(text: str, limit: int) -> str:
+    """按与 estimate_tokens 相同的规则截断文本，使估算值不超过 limit"""
+    cost, cut = 0.0, len(text)
+    for i, ch in enumerate(text):
+        cost += 1.0 if ('\u3000' <= ch <= '\u9fff' or '\uff00' <= ch <= '\uffef') else 0.25
+        if cost > limit:
+            cut = i
+            break
+    return text[:cut]
+
+
+def shape_user_prompt(prompt: str, settings: dict) -> str:
+    """用户提示词超过预算时按设置截断或拒绝"""
+    limit = int(settings["max_prompt_tokens"] or 0)
+    tokens = estimate_tokens(prompt)
+    if not limit or tokens <= limit:
+        return prompt
+    if settings["oversize_action"] == "reject":
+        raise ValueError(f"提示词过长 (约 {tokens} tokens)，超过预设上限 {limit} tokens。")
+    print(f"✂️ 提示词约 {tokens} tokens，已截断到 {limit} tokens 以内。")
+    return truncate_to_tokens(prompt, limit)
+
+
+def estimate_payload_tokens(payload) -> int:
+    """估算请求体中所有文本和图片的输入 token 数"""
+    if isinstance(payload, dict):
+        if "inline_data" in payload or "image_url" in payload:
+            return IMAGE_TOKEN_ESTIMATE
+        total = 0
+        for key, value in payload.items():
+            if key in ("text", "content") and isinstance(value, str):
+                total += estimate_tokens(value)
+            else:
+                total += estimate_payload_tokens(value)
+        return total
+    if isinstance(payload, list):
+        return sum(estimate_payload_tokens(item) for item in payload)
+    return 0
+
+
+def output_token_limit(settings: dict, vision: bool, en_only: bool) -> int:
+    if en_only:
+        return int(settings["en_only_max_output_tokens"] or 0)
+    return int(settings["vision_max_output_tokens" if vision else "max_output_tokens"] or 0)
+
+
+def apply_budget(service_type: str, payload: dict, settings: dict, vision: bool, en_only: bool) -> int:
+    """检查输入预算，并在请求体中写入对应服务的输出上限字段；返回输入与输出上限之和，供限速器估算 TPM"""
+    input_tokens = estimate_payload_tokens(payload)
+    max_input = int(settings["max_input_tokens"] or 0)
+    if max_input and input_tokens > max_input:
+        raise ValueError(f"请求估算约 {input_tokens} tokens，超过预设的输入上限 {max_input} tokens。")
+    max_output = output_token_limit(settings, vision, en_only)
+    if service_type == "Gemini" and not settings["gemini_output_cap"]:
+        # 思考模型可能在上限内只完成思考、不输出任何文本，默认不限制；上限仍用于估算 TPM
+        print(f"📏 预计输入约 {input_tokens} tokens，Gemini 输出不限 (按 {max_output} tokens 估算)。")
+        return input_tokens + max_output
+    if max_output:
+        if service_type == "Gemini":
+            payload.setdefault("generationConfig", {})["maxOutputTokens"] = max_output
+        else:
+            payload["max_tokens"] = max_output
+    print(f"📏 预计输入约 {input_tokens} tokens，输出上限 {max_output or '不限'} tokens。")
+    return input_tokens + max_output
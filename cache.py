@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from .common import PLUGIN_ROOT
+
+# 缓存文件统一放在插件目录下的 cache 文件夹中
+CACHE_DIR = os.path.join(PLUGIN_ROOT, "cache")
+RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite3")
+
+# 默认淘汰策略：最多保留 2000 条，单条最长保存 7 天
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def make_cache_key(*parts) -> str:
+    """将请求的各个组成部分序列化后取 SHA-256，作为内容寻址的缓存键"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的磁盘响应缓存，支持 LRU + TTL 淘汰和条目数量上限。
+    同一个实例可以被多个执行线程共享。
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        # 首次使用时才创建数据库，避免节点注册阶段产生磁盘 I/O
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str):
+        with self._lock:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                now = time.time()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    if row is not None:
+                        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        conn.commit()
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                conn.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            except Exception as e:
+                # 缓存损坏不应影响正常调用，按未命中处理
+                print(f"⚠️ 读取响应缓存失败: {e}")
+                self.misses += 1
+                return None
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            try:
+                conn = self._connect()
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now),
+                )
+                self._evict(conn, now)
+                conn.commit()
+            except Exception as e:
+                print(f"⚠️ 写入响应缓存失败: {e}")
+
+    def _evict(self, conn, now: float) -> None:
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> str:
+        return f"命中: {self.hits} / 未命中: {self.misses}"
+
+
+# 所有优化器节点共享同一个缓存实例
+response_cache = ResponseCache()
+
+
+TRANSLATION_MEMORY_PATH = os.path.join(CACHE_DIR, "translations.sqlite3")
+DEFAULT_TM_MAX_ENTRIES = 50000
+
+
+class TranslationMemory:
+    """
+    本地翻译记忆库，按 (翻译方向, 服务, 规范化片段) 存储片段级译文。
+    提示词库中大量重复的短语和标签只需翻译一次。
+    """
+
+    def __init__(self, path: str = TRANSLATION_MEMORY_PATH, max_entries: int = DEFAULT_TM_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "direction TEXT NOT NULL, service TEXT NOT NULL, segment TEXT NOT NULL, "
+                "translation TEXT NOT NULL, last_access REAL NOT NULL, "
+                "PRIMARY KEY (direction, service, segment))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get_many(self, direction: str, service: str, segments) -> dict:
+        """返回已存在于记忆库中的 {片段: 译文}，并刷新其访问时间"""
+        found = {}
+        with self._lock:
+            try:
+                conn = self._connect()
+                now = time.time()
+                for segment in set(segments):
+                    row = conn.execute(
+                        "SELECT translation FROM translations WHERE direction = ? AND service = ? AND segment = ?",
+                        (direction, service, segment),
+                    ).fetchone()
+                    if row is not None:
+                        found[segment] = row[0]
+                        conn.execute(
+                            "UPDATE translations SET last_access = ? WHERE direction = ? AND service = ? AND segment = ?",
+                            (now, direction, service, segment),
+                        )
+                conn.commit()
+            except Exception as e:
+                print(f"⚠️ 读取翻译记忆库失败: {e}")
+            self.hits += len(found)
+            self.misses += len(set(segments)) - len(found)
+        return found
+
+    def put_many(self, direction: str, service: str, pairs: dict) -> None:
+        if not pairs:
+            return
+        with self._lock:
+            try:
+                conn = self._connect()
+                now = time.time()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO translations (direction, service, segment, translation, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(direction, service, segment, translation, now) for segment, translation in pairs.items()],
+                )
+                conn.execute(
+                    "DELETE FROM translations WHERE rowid IN ("
+                    "SELECT rowid FROM translations ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                conn.commit()
+            except Exception as e:
+                print(f"⚠️ 写入翻译记忆库失败: {e}")
+
+    def stats(self) -> str:
+        return f"命中: {self.hits} / 未命中: {self.misses}"
+
+
+# 所有翻译器节点共享同一个翻译记忆库
+translation_memory = TranslationMemory()
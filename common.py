@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 import os
-import requests
 import json
 import inspect
+import threading
+import time
 
 # 服务配置字典，仅用于温度映射
 SERVICE_CONFIG = {
@@ -22,30 +23,153 @@ def get_plugin_root():
 PLUGIN_ROOT = get_plugin_root()
 CONFIG_PATH = os.path.join(PLUGIN_ROOT, "config.json")
 
-# --- 优化点: 移除缓存，实现热重载 ---
-def load_preset_configs():
-    """
-    从插件根目录加载 config.json 文件。
-    移除缓存机制，使得每次调用都会重新读取文件，
-    这样用户在ComfyUI界面点击刷新即可加载新配置。
-    """
-    if not os.path.exists(CONFIG_PATH):
-        # 即使文件不存在也不报错，而是在UI中显示提示
-        return []
-    
+# --- 优化点: 只解析一次，按文件修改时间/大小热重载 ---
+REQUIRED_PRESET_FIELDS = ("name", "type", "api_base")
+# 路由组预设: 由多个普通预设组成，按顺序故障转移
+ROUTING_GROUP_TYPE = "Group"
+
+_config_lock = threading.Lock()
+_config_state = {"signature": None, "configs": [], "index": {}, "names": [], "sections": {}}
+
+def _config_signature():
+    """用文件的修改时间和大小判断 config.json 是否发生了变化"""
+    try:
+        stat = os.stat(CONFIG_PATH)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _validate_presets(presets: list) -> list:
+    """加载时做一次结构校验，跳过不合法的预设"""
+    valid, seen = [], set()
+    for i, preset in enumerate(presets):
+        if not isinstance(preset, dict):
+            print(f"⚠️ config.json 第 {i + 1} 个预设不是对象，已跳过。")
+            continue
+        if preset.get("type") == ROUTING_GROUP_TYPE:
+            members = preset.get("members")
+            if not isinstance(preset.get("name"), str) or not isinstance(members, list) or not all(isinstance(m, str) for m in members):
+                print(f"⚠️ 路由组 '{preset.get('name', i + 1)}' 需要 name 和 members(预设名称列表)，已跳过。")
+                continue
+            required = ()
+        else:
+            required = REQUIRED_PRESET_FIELDS
+        missing = [field for field in required if not isinstance(preset.get(field), str) or not preset.get(field)]
+        if missing:
+            print(f"⚠️ 预设 '{preset.get('name', i + 1)}' 缺少字段 {missing}，已跳过。")
+            continue
+        if preset["type"] not in SERVICE_CONFIG and preset["type"] != ROUTING_GROUP_TYPE:
+            print(f"⚠️ 预设 '{preset['name']}' 的类型 '{preset['type']}' 不受支持，已跳过。")
+            continue
+        if preset["name"] in seen:
+            print(f"⚠️ 预设名称 '{preset['name']}' 重复，已忽略后出现的一个。")
+            continue
+        seen.add(preset["name"])
+        valid.append(preset)
+    return valid
+
+def _read_config_file():
+    """返回 (预设列表, 其余顶层字段)"""
     try:
         with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
             config_data = json.load(f)
-            if "configurations" in config_data and isinstance(config_data["configurations"], list):
-                print(f"✅ 成功加载 {len(config_data['configurations'])} 个预设配置。")
-                return config_data["configurations"]
-            else:
-                print("❌ config.json 文件格式错误：缺少 'configurations' 列表。")
-                return []
     except Exception as e:
         print(f"❌ 加载 config.json 文件时发生未知错误: {e}")
-        return []
+        return [], {}
+    sections = {key: value for key, value in config_data.items() if key != "configurations"}
+    if "configurations" in config_data and isinstance(config_data["configurations"], list):
+        presets = _validate_presets(config_data["configurations"])
+        print(f"✅ 成功加载 {len(presets)} 个预设配置。")
+        return presets, sections
+    print("❌ config.json 文件格式错误：缺少 'configurations' 列表。")
+    return [], sections
+
+def _refresh_configs() -> dict:
+    """只有当 config.json 的修改时间或大小变化时才重新解析"""
+    signature = _config_signature()
+    with _config_lock:
+        if signature != _config_state["signature"]:
+            # 即使文件不存在也不报错，而是在UI中显示提示
+            configs, sections = _read_config_file() if signature is not None else ([], {})
+            _config_state["configs"] = configs
+            _config_state["sections"] = sections
+            _config_state["index"] = {preset["name"]: preset for preset in configs}
+            _config_state["names"] = [preset["name"] for preset in configs]
+            _config_state["signature"] = signature
+        return _config_state
+
+def load_preset_configs():
+    """
+    返回 config.json 中的预设列表。
+    文件只在首次调用或内容变化后解析一次，
+    用户修改文件后在ComfyUI界面点击刷新即可加载新配置。
+    """
+    return _refresh_configs()["configs"]
+
+def get_preset_names():
+    """返回预设名称列表，供 INPUT_TYPES 使用；配置未变化时只检查一次文件状态，不重新读取"""
+    return list(_refresh_configs()["names"])
+
+def get_preset(name: str):
+    """按名称查找预设，找不到时返回 None"""
+    return _refresh_configs()["index"].get(name)
+
+def get_config_section(key: str, default=None):
+    """读取 config.json 中 "configurations" 以外的顶层字段，例如 "templates" """
+    return _refresh_configs()["sections"].get(key, default)
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数，不依赖任何分词库：
+    中日韩字符约 1 字 1 token，其余字符约 4 个字符 1 token。
+    """
+    cjk = sum(1 for ch in text if '\u3000' <= ch <= '\u9fff' or '\uff00' <= ch <= '\uffef')
+    return cjk + (len(text) - cjk + 3) // 4
 
 def clean_text(text: str) -> str:
     """清理AI返回的文本，移除不必要的字符"""
     return text.strip().replace("\n", " ").replace("\"", "")
+
+
+# --- HTTP连接设置: 共享连接池的实现在 transport.py 中 ---
+DEFAULT_HTTP_SETTINGS = {
+    "pool_size": 10,        # 每个主机保持的最大连接数
+    "keep_alive": True,     # 是否复用长连接
+    "connect_timeout": 10,  # 建立连接的超时(秒)
+    "read_timeout": 180,    # 等待响应的超时(秒)
+}
+
+def get_http_settings(config: dict = None) -> dict:
+    """合并默认设置和预设中的 "http" 字段"""
+    settings = dict(DEFAULT_HTTP_SETTINGS)
+    if config and isinstance(config.get("http"), dict):
+        settings.update(config["http"])
+    return settings
+
+def http_post(url: str, config: dict = None, **kwargs):
+    # requests/urllib3 只在第一次发送请求时加载，节点注册时不导入
+    from .transport import send
+    return send("POST", url, config, kwargs)
+
+def http_get(url: str, config: dict = None, **kwargs):
+    from .transport import send
+    return send("GET", url, config, kwargs)
+
+
+class RateLimiter:
+    """简单的每分钟请求数限制器，多个线程按先后顺序领取发送时间"""
+
+    def __init__(self, rpm: float = 0):
+        self.interval = 60.0 / rpm if rpm and rpm > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_time)
+            self._next_time = send_at + self.interval
+        if send_at > now:
+            time.sleep(send_at - now)
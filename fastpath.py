@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import List, Tuple
+
+# 本地快速通道使用的风格关键词表，按界面中的风格选项索引
+STYLE_KEYWORDS = {
+    "摄影": ["photography", "natural lighting", "sharp focus", "depth of field"],
+    "写实": ["photorealistic", "realistic", "detailed textures", "lifelike"],
+    "动漫": ["anime style", "cel shading", "vibrant colors", "clean lineart"],
+    "3D模型": ["3d render", "octane render", "physically based rendering", "studio lighting"],
+    "电影感": ["cinematic", "film still", "dramatic lighting", "anamorphic"],
+    "概念艺术": ["concept art", "digital painting", "matte painting", "artstation"],
+    "建筑设计": ["architectural photography", "clean lines", "wide angle", "architectural visualization"],
+    "奇幻": ["fantasy", "magical atmosphere", "ethereal", "epic"],
+    "赛博朋克": ["cyberpunk", "neon lights", "futuristic city", "high tech"],
+    "蒸汽朋克": ["steampunk", "brass and copper", "victorian", "clockwork"],
+    "水墨画": ["ink wash painting", "sumi-e", "monochrome ink", "brush strokes"],
+    "油画": ["oil painting", "impasto", "canvas texture", "classical painting"],
+    "水彩画": ["watercolor", "soft washes", "paper texture", "bleeding colors"],
+    "素描": ["pencil sketch", "graphite", "hatching", "monochrome"],
+    "像素艺术": ["pixel art", "8-bit", "limited palette", "retro game"],
+    "低多边形": ["low poly", "flat shading", "geometric", "minimal polygons"],
+    "简约": ["minimalist", "clean composition", "negative space", "simple background"],
+    "复古": ["vintage", "retro", "film grain", "faded colors"],
+}
+
+# 关键词风格的模型常用的画质标签；Flux 使用自然语言，不追加
+QUALITY_TAGS = {
+    "SDXL": ["masterpiece", "best quality", "highly detailed"],
+    "通用": ["masterpiece", "best quality", "highly detailed"],
+}
+
+WEIGHT_PATTERN = re.compile(r"^\(\s*([^():]+?)\s*:\s*([0-9]*\.?[0-9]+)\s*\)$")
+MIN_WEIGHT, MAX_WEIGHT = 0.1, 2.0
+CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+# 默认的快速通道设置，可在预设的 "fast_path" 字段中覆盖
+DEFAULT_FAST_PATH_SETTINGS = {
+    "threshold": 0.8,   # 本地评分达到该值时跳过LLM
+    "min_tags": 12,     # 标签数达到该值时数量得分记满分
+}
+
+
+class PromptAnalysis:
+    """本地预分析的结果：规范化后的提示词、评分和处理记录"""
+
+    def __init__(self, prompt: str, score: float, notes: List[str]):
+        self.prompt = prompt
+        self.score = score
+        self.notes = notes
+
+
+def get_fast_path_settings(config: dict) -> dict:
+    settings = dict(DEFAULT_FAST_PATH_SETTINGS)
+    if isinstance(config.get("fast_path"), dict):
+        settings.update(config["fast_path"])
+    return settings
+
+
+def split_tags(prompt: str) -> List[str]:
+    """
+    按逗号和换行拆分标签，括号内的逗号不拆分，使 (red hair, blue eyes:1.3) 这样的分组权重保持完整；
+    末尾括号没有闭合时，未闭合的部分仍按逗号拆分，交给权重校验修正。
+    """
+    tags, current, depth = [], [], 0
+    for ch in prompt:
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth = max(0, depth - 1)
+        elif ch in ",\n" and depth == 0:
+            tags.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    tail = "".join(current)
+    if depth > 0:
+        tags.extend(tail.replace("\n", ",").split(","))
+    else:
+        tags.append(tail)
+    return [" ".join(tag.split()) for tag in tags if tag.strip()]
+
+
+def _normalize_weight(tag: str, notes: List[str]) -> str:
+    """规范 (tag:1.4) 或 (tag1, tag2:1.4) 权重写法，权重超出范围时截断到合法区间"""
+    match = WEIGHT_PATTERN.match(tag)
+    if not match:
+        # 不带权重的 ((tag)) 是合法的强调写法；括号不配对或权重不是数字时才修正
+        balanced = tag.count("(") == tag.count(")")
+        if not balanced or ("(" in tag and ":" in tag):
+            cleaned = re.sub(r"[():]|\b\d*\.\d+\b", " ", tag)
+            cleaned = " ".join(cleaned.split())
+            notes.append(f"修正了无效的权重写法 '{tag}'")
+            return cleaned
+        return tag
+    text, weight = match.group(1), float(match.group(2))
+    clamped = min(MAX_WEIGHT, max(MIN_WEIGHT, weight))
+    if clamped != weight:
+        notes.append(f"权重 '{tag}' 超出范围，已调整为 {clamped:g}")
+    return f"({text}:{clamped:g})"
+
+
+def _tag_text(tag: str) -> str:
+    """去掉权重和 ((tag)) / [tag] 强调括号后的标签文本，用于去重和比较"""
+    match = WEIGHT_PATTERN.match(tag)
+    if match:
+        return match.group(1).lower()
+    while len(tag) > 1 and tag[0] + tag[-1] in ("()", "[]"):
+        tag = tag[1:-1].strip()
+    return tag.lower()
+
+
+def normalize_tags(prompt: str, negative_prompt: str = "") -> Tuple[List[str], List[str]]:
+    """按逗号拆分标签，规范空白和权重写法，去重并移除与负面提示词冲突的标签"""
+    notes = []
+    negative_tags = {_tag_text(tag) for tag in split_tags(negative_prompt)}
+    tags, seen = [], set()
+    for tag in split_tags(prompt):
+        tag = _normalize_weight(tag, notes)
+        key = _tag_text(tag)
+        if not key:
+            continue
+        if key in seen:
+            notes.append(f"移除了重复标签 '{tag}'")
+            continue
+        if key in negative_tags:
+            notes.append(f"移除了与负面提示词冲突的标签 '{tag}'")
+            continue
+        seen.add(key)
+        tags.append(tag)
+    return tags, notes
+
+
+def score_prompt(tags: List[str], target_model: str, min_tags: int = 12) -> float:
+    """
+    估算提示词已经“足够好”的程度 (0~1)：
+    标签数量占 60%，描述词汇的丰富程度占 40%；
+    Flux 更适合自然语言，纯短标签的提示词会被扣分。
+    """
+    if not tags:
+        return 0.0
+    words = [word for tag in tags for word in _tag_text(tag).split()]
+    tag_score = min(1.0, len(tags) / min_tags)
+    vocabulary_score = min(1.0, len(set(words)) / (min_tags * 2))
+    score = 0.6 * tag_score + 0.4 * vocabulary_score
+    if target_model == "Flux" and len(words) / len(tags) < 3:
+        score -= 0.3
+    return max(0.0, round(score, 3))
+
+
+def analyze_prompt(prompt: str, target_model: str, style: str, negative_prompt: str = "",
+                   min_tags: int = 12) -> PromptAnalysis:
+    """本地规范化提示词、注入风格关键词，并给出是否需要LLM改写的评分"""
+    if CJK_PATTERN.search(prompt):
+        # 包含中文的提示词需要翻译，始终交给LLM
+        return PromptAnalysis(prompt, 0.0, ["提示词包含中文，需要LLM处理"])
+
+    tags, notes = normalize_tags(prompt, negative_prompt)
+    score = score_prompt(tags, target_model, min_tags)
+
+    existing = {_tag_text(tag) for tag in tags}
+    injected = [keyword for keyword in STYLE_KEYWORDS.get(style, []) + QUALITY_TAGS.get(target_model, [])
+                if keyword.lower() not in existing]
+    if injected:
+        notes.append(f"追加了关键词: {', '.join(injected)}")
+    return PromptAnalysis(", ".join(tags + injected), score, notes)
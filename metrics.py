@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from .common import PLUGIN_ROOT, get_config_section
+
+LOG_DIR = os.path.join(PLUGIN_ROOT, "logs")
+# 默认关闭文件输出；在 config.json 的 "metrics" 字段中开启
+DEFAULT_METRICS_SETTINGS = {
+    "jsonl": False,       # true 或文件路径: 每次调用追加一行JSON
+    "prometheus": False,  # true 或文件路径: 写入 Prometheus 文本格式的汇总指标
+}
+
+_current_call = contextvars.ContextVar("ai_prompt_current_call", default=None)
+
+
+class CallMetrics:
+    """一次节点调用的各阶段耗时、token 数和收发字节数"""
+
+    def __init__(self, node: str, service: str):
+        self.node = node
+        self.service = service
+        self.provider = None
+        self.status = "ok"
+        self.started_at = time.time()
+        self.stages = {}
+        self.tokens = {"prompt": 0, "completion": 0, "total": 0}
+        self.bytes = {"request": 0, "response": 0}
+        self.http_requests = 0
+        self.cache = None
+        self.fast_path = None
+        self.coalesced = False
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_tokens(self, prompt: int = 0, completion: int = 0, total: int = 0) -> None:
+        self.tokens["prompt"] += prompt
+        self.tokens["completion"] += completion
+        self.tokens["total"] += total or (prompt + completion)
+
+    def to_dict(self) -> dict:
+        return {
+            "node": self.node,
+            "service": self.service,
+            "provider": self.provider,
+            "status": self.status,
+            "timestamp": round(self.started_at, 3),
+            "cache": self.cache,
+            "fast_path": self.fast_path,
+            "coalesced": self.coalesced,
+            "http_requests": self.http_requests,
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            "tokens": self.tokens,
+            "bytes": self.bytes,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+
+class MetricsRegistry:
+    """进程内的汇总指标，用于 Prometheus 文本输出"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.tokens = {}
+        self.bytes = {}
+        self.stage_sum = {}
+        self.stage_count = {}
+        self.fast_path = {}
+        self.coalesced = {}
+
+    def observe(self, call: CallMetrics) -> None:
+        with self._lock:
+            key = (call.node, call.service, call.status)
+            self.calls[key] = self.calls.get(key, 0) + 1
+            for kind in ("prompt", "completion"):
+                token_key = (call.node, call.service, kind)
+                self.tokens[token_key] = self.tokens.get(token_key, 0) + call.tokens[kind]
+            for direction, count in call.bytes.items():
+                byte_key = (call.node, direction)
+                self.bytes[byte_key] = self.bytes.get(byte_key, 0) + count
+            for stage, seconds in call.stages.items():
+                stage_key = (call.node, stage)
+                self.stage_sum[stage_key] = self.stage_sum.get(stage_key, 0.0) + seconds
+                self.stage_count[stage_key] = self.stage_count.get(stage_key, 0) + 1
+            if call.fast_path is not None:
+                fast_key = (call.node, "hit" if call.fast_path else "miss")
+                self.fast_path[fast_key] = self.fast_path.get(fast_key, 0) + 1
+            if call.coalesced:
+                self.coalesced[call.node] = self.coalesced.get(call.node, 0) + 1
+
+    def render_prometheus(self) -> str:
+        def labels(**pairs):
+            return ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in pairs.items())
+
+        lines = []
+        with self._lock:
+            lines.append("# TYPE ai_prompt_calls_total counter")
+            for (node, service, status), value in sorted(self.calls.items()):
+                lines.append(f"ai_prompt_calls_total{{{labels(node=node, service=service, status=status)}}} {value}")
+            lines.append("# TYPE ai_prompt_tokens_total counter")
+            for (node, service, kind), value in sorted(self.tokens.items()):
+                lines.append(f"ai_prompt_tokens_total{{{labels(node=node, service=service, kind=kind)}}} {value}")
+            lines.append("# TYPE ai_prompt_bytes_total counter")
+            for (node, direction), value in sorted(self.bytes.items()):
+                lines.append(f"ai_prompt_bytes_total{{{labels(node=node, direction=direction)}}} {value}")
+            lines.append("# TYPE ai_prompt_stage_seconds summary")
+            for (node, stage), value in sorted(self.stage_sum.items()):
+                lines.append(f"ai_prompt_stage_seconds_sum{{{labels(node=node, stage=stage)}}} {value:.6f}")
+                lines.append(f"ai_prompt_stage_seconds_count{{{labels(node=node, stage=stage)}}} {self.stage_count[(node, stage)]}")
+            lines.append("# TYPE ai_prompt_fast_path_total counter")
+            for (node, result), value in sorted(self.fast_path.items()):
+                lines.append(f"ai_prompt_fast_path_total{{{labels(node=node, result=result)}}} {value}")
+            lines.append("# TYPE ai_prompt_coalesced_total counter")
+            for node, value in sorted(self.coalesced.items()):
+                lines.append(f"ai_prompt_coalesced_total{{{labels(node=node)}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+_file_lock = threading.Lock()
+
+
+def get_metrics_settings() -> dict:
+    settings = dict(DEFAULT_METRICS_SETTINGS)
+    section = get_config_section("metrics")
+    if isinstance(section, dict):
+        settings.update(section)
+    return settings
+
+
+def _output_path(value, default_name: str):
+    if not value:
+        return None
+    return os.path.join(LOG_DIR, default_name) if value is True else os.path.expanduser(str(value))
+
+
+def _export(call: CallMetrics) -> None:
+    settings = get_metrics_settings()
+    jsonl_path = _output_path(settings["jsonl"], "metrics.jsonl")
+    prometheus_path = _output_path(settings["prometheus"], "metrics.prom")
+    if not jsonl_path and not prometheus_path:
+        return
+    try:
+        with _file_lock:
+            if jsonl_path:
+                os.makedirs(os.path.dirname(jsonl_path), exist_ok=True)
+                with open(jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(call.to_json() + "\n")
+            if prometheus_path:
+                # 先写临时文件再替换，避免采集端读到一半的内容
+                os.makedirs(os.path.dirname(prometheus_path), exist_ok=True)
+                tmp_path = f"{prometheus_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(registry.render_prometheus())
+                os.replace(tmp_path, prometheus_path)
+    except Exception as e:
+        print(f"⚠️ 写入性能指标失败: {e}")
+
+
+@contextmanager
+def track_call(node: str, service: str):
+    """记录一次节点调用；在其中执行的阶段计时、HTTP请求和 token 统计都会归入这次调用"""
+    call = CallMetrics(node, service)
+    token = _current_call.set(call)
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call.status = "error"
+        raise
+    finally:
+        call.add_stage("total", time.perf_counter() - start)
+        _current_call.reset(token)
+        registry.observe(call)
+        _export(call)
+
+
+def current_call():
+    return _current_call.get()
+
+
+@contextmanager
+def stage(name: str):
+    """为当前调用的某个阶段计时；不在 track_call 中时不做任何记录"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    call = _current_call.get()
+    if call is not None:
+        call.add_stage(name, seconds)
+
+
+def record_http(request_bytes: int, response_bytes: int, ttfb: float) -> None:
+    call = _current_call.get()
+    if call is not None:
+        call.http_requests += 1
+        call.bytes["request"] += request_bytes
+        call.bytes["response"] += response_bytes
+        call.add_stage("ttfb", ttfb)
+
+
+def record_response_bytes(count: int) -> None:
+    call = _current_call.get()
+    if call is not None:
+        call.bytes["response"] += count
+
+
+def record_usage(service_type: str, data: dict) -> None:
+    """从 OpenAI 兼容接口的 usage 或 Gemini 的 usageMetadata 中读取 token 数"""
+    call = _current_call.get()
+    if call is None or not isinstance(data, dict):
+        return
+    if service_type == "Gemini":
+        usage = data.get("usageMetadata") or {}
+        call.add_tokens(usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0), usage.get("totalTokenCount", 0))
+    else:
+        usage = data.get("usage") or {}
+        call.add_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), usage.get("total_tokens", 0))
+
+
+def install_metrics_route() -> None:
+    """在ComfyUI服务端注册 /ai_prompt_tools/metrics，以 Prometheus 文本格式返回汇总指标"""
+    try:
+        from aiohttp import web
+        from server import PromptServer
+
+        @PromptServer.instance.routes.get("/ai_prompt_tools/metrics")
+        async def metrics_endpoint(request):
+            return web.Response(text=registry.render_prometheus(), content_type="text/plain")
+    except Exception:
+        pass
@@ -1,16 +1,31 @@
 # -*- coding: utf-8 -*-
-import torch
-import numpy as np
-from PIL import Image
 import io
 import base64
-import requests
 import json
 import re
-from typing import Tuple
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, List, TYPE_CHECKING
+
+# torch 和 Pillow 只在图生文模式下加载，节点注册和纯文本模式不导入
+if TYPE_CHECKING:
+    import torch
 
 # 从共享文件中导入通用配置和函数
-from .common import SERVICE_CONFIG, clean_text, load_preset_configs
+from .common import SERVICE_CONFIG, clean_text, get_preset_names, get_preset, http_post, RateLimiter, estimate_tokens
+from .cache import response_cache, make_cache_key
+from .streaming import to_stream_request, read_stream, finish_reason, response_text, OUTPUT_CAP_REASONS, OUTPUT_CAP_ERROR
+from .templates import prompt_templates
+from .routing import is_routing_group, run_routed
+from .async_runtime import run_in_background, select_function
+from .metrics import track_call, stage, current_call, record_usage
+from .budget import get_budget_settings, shape_user_prompt, apply_budget, estimate_payload_tokens
+from .fastpath import analyze_prompt, get_fast_path_settings
+from .singleflight import single_flight
 
 class AIPromptRefiner:
     """
@@ -25,10 +40,12 @@ class AIPromptRefiner:
         "动漫优化": "bad hands, bad fingers, missing fingers, extra fingers, ugly, deformed, noisy, blurry, distorted, grainy"
     }
 
+    STREAM_MODES = ["关闭", "流式", "流式(仅提示词)"]
+    OUTPUT_MODES = ["提示词+笔记", "仅提示词"]
+
     @classmethod
     def INPUT_TYPES(cls):
-        preset_configs = load_preset_configs()
-        preset_names = [config["name"] for config in preset_configs]
+        preset_names = get_preset_names()
         if not preset_names:
             preset_names = ["未找到配置,请检查config.json"]
 
@@ -55,188 +72,365 @@ class AIPromptRefiner:
                 "negative_mode": (list(cls.NEGATIVE_PROMPTS.keys()) + ["自定义"], {"default": "基础模板", "tooltip": "选择负面提示词模板。"}),
                 "custom_negative": ("STRING", {"multiline": True, "default": "", "tooltip": "当选择“自定义”负面模式时，此处内容生效。"}),
             },
-            "optional": { "image": ("IMAGE", {"tooltip": "(可选) 连接图片以启用“图生文”模式。"}) }
+            "optional": {
+                "image": ("IMAGE", {"tooltip": "(可选) 连接图片以启用“图生文”模式。"}),
+                "bypass_cache": ("BOOLEAN", {"default": False, "label_on": "跳过缓存", "label_off": "使用缓存", "tooltip": "开启后忽略本地响应缓存，强制重新调用API。"}),
+                "stream_mode": (cls.STREAM_MODES, {"default": "关闭", "tooltip": "流式接收响应。“仅提示词”模式在英文提示词完整后立即断开，不等待中文优化笔记。"}),
+                "output_mode": (cls.OUTPUT_MODES, {"default": "提示词+笔记", "tooltip": "“仅提示词”模式不再请求中文优化笔记，输出更短、更快、更便宜。"}),
+                "fast_path": ("BOOLEAN", {"default": False, "label_on": "本地快速通道", "label_off": "总是调用AI", "tooltip": "开启后先在本地规范化标签并评分，已经足够完善的提示词不再调用API。"}),
+            }
         }
 
-    RETURN_TYPES = ("STRING", "STRING", "STRING")
-    RETURN_NAMES = ("优化后的提示词", "负面提示词", "优化笔记")
-    FUNCTION = "refine_prompt"
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("优化后的提示词", "负面提示词", "优化笔记", "性能指标")
+    # 新版ComfyUI使用异步函数，等待API时不阻塞其他节点
+    FUNCTION = select_function("refine_prompt", "refine_prompt_async")
+    PREFETCH_FUNCTION = "refine_prompt"
     CATEGORY = "AI提示词工具"
 
     def _get_config_details(self, selection):
-        for preset in load_preset_configs():
-            if preset["name"] == selection:
-                print(f"✅ 使用配置文件 '{selection}'")
-                return preset
+        preset = get_preset(selection)
+        if preset is not None:
+            return preset
         
         raise ValueError(f"找不到名为 '{selection}' 的配置。请重启ComfyUI或检查config.json文件。")
 
-    def _tensor_to_base64(self, tensor: torch.Tensor) -> str:
-        image_np = tensor.squeeze(0).cpu().numpy()
-        image_np = (image_np * 255).astype(np.uint8)
-        pil_image = Image.fromarray(image_np)
-        max_dim = 2048
-        if pil_image.width > max_dim or pil_image.height > max_dim:
-            pil_image.thumbnail((max_dim, max_dim))
-            print(f"ℹ️ 图片尺寸已调整为 {pil_image.size} 以符合API限制。")
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format="JPEG")
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
-
-    def _get_style_map(self):
-        return {
-            "通用": "General", "摄影": "Photographic", "写实": "Realistic", "动漫": "Anime", "3D模型": "3D Model", 
-            "电影感": "Cinematic", "概念艺术": "Concept Art", "建筑设计": "Architectural", "奇幻": "Fantasy", 
-            "赛博朋克": "Cyberpunk", "蒸汽朋克": "Steampunk", "水墨画": "Ink Wash Painting", "油画": "Oil Painting", 
-            "水彩画": "Watercolor", "素描": "Sketch", "像素艺术": "Pixel Art", "低多边形": "Low Poly", 
-            "简约": "Minimalist", "复古": "Vintage"
-        }
+    # 视觉模式的默认编码设置，可在预设的 "vision" 字段中覆盖
+    DEFAULT_VISION_SETTINGS = {"max_dim": 1024, "quality": 85, "format": "JPEG"}
+    IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+    ENCODED_IMAGE_MEMO_SIZE = 16
 
-    def _build_text_system_prompt(self, style: str, detail_level: str, strict_mode: bool, target_model: str) -> str:
-        strict_instruction = " Your entire response must strictly follow the format: [EN] english prompt [ZH] chinese optimization notes." if strict_mode else ""
-        
-        style_map = self._get_style_map()
-        detail_map = {"基础": "Basic", "详细": "Detailed", "极其详细": "Ultra Detailed"}
+    _encoded_image_memo = OrderedDict()
+    _encoded_image_lock = threading.Lock()
+
+    def _get_vision_settings(self, config: dict) -> dict:
+        settings = dict(self.DEFAULT_VISION_SETTINGS)
+        if isinstance(config.get("vision"), dict):
+            settings.update(config["vision"])
+        settings["format"] = str(settings["format"]).upper()
+        if settings["format"] not in self.IMAGE_MIME_TYPES:
+            raise ValueError(f"不支持的图片编码格式 '{settings['format']}'，可选: {list(self.IMAGE_MIME_TYPES)}")
+        return settings
+
+    def _resize_tensor(self, tensor: "torch.Tensor", max_dim: int) -> "torch.Tensor":
+        """在原设备上先缩小图片，再做 uint8 转换和拷贝，避免处理全分辨率数据"""
+        import torch
+        if tensor.dim() == 3:
+            tensor = tensor.unsqueeze(0)
+        height, width = tensor.shape[1], tensor.shape[2]
+        scale = max_dim / max(height, width)
+        if scale < 1:
+            size = (max(1, round(height * scale)), max(1, round(width * scale)))
+            tensor = torch.nn.functional.interpolate(tensor.movedim(-1, 1), size=size, mode="area").movedim(1, -1)
+            print(f"ℹ️ 图片尺寸已从 {(width, height)} 调整为 {(size[1], size[0])} 以减少上传体积。")
+        return tensor
+
+    def _tensor_to_base64(self, tensor: "torch.Tensor", settings: dict = None) -> List[str]:
+        """把 IMAGE 张量(支持批量)编码为 base64 图片列表，相同图片的编码结果会被复用"""
+        import torch
+        from PIL import Image
+        settings = settings or self.DEFAULT_VISION_SETTINGS
+        with torch.no_grad():
+            resized = self._resize_tensor(tensor, int(settings["max_dim"]))
+            images_np = (resized.clamp(0, 1) * 255).round().to(torch.uint8).cpu().numpy()
+
+        encoded = []
+        for image_np in images_np:
+            digest = hashlib.blake2b(image_np.tobytes(), digest_size=16).hexdigest()
+            memo_key = (digest, image_np.shape, settings["format"], settings["quality"])
+            with self._encoded_image_lock:
+                cached = self._encoded_image_memo.get(memo_key)
+                if cached is not None:
+                    self._encoded_image_memo.move_to_end(memo_key)
+            if cached is None:
+                pil_image = Image.fromarray(image_np.squeeze(-1) if image_np.shape[-1] == 1 else image_np)
+                if settings["format"] == "JPEG" and pil_image.mode != "RGB":
+                    pil_image = pil_image.convert("RGB")
+                buffer = io.BytesIO()
+                pil_image.save(buffer, format=settings["format"], quality=int(settings["quality"]))
+                cached = base64.b64encode(buffer.getvalue()).decode('utf-8')
+                with self._encoded_image_lock:
+                    self._encoded_image_memo[memo_key] = cached
+                    while len(self._encoded_image_memo) > self.ENCODED_IMAGE_MEMO_SIZE:
+                        self._encoded_image_memo.popitem(last=False)
+            encoded.append(cached)
+        return encoded
+
+    def _build_text_system_prompt(self, style: str, detail_level: str, strict_mode: bool, target_model: str,
+                                  en_only: bool = False) -> str:
+        return prompt_templates.text_system_prompt(style, detail_level, strict_mode, target_model, en_only)
+
+    def _refine_with_preset(self, config: dict, prompt: str, target_model: str, strict_mode: bool, style: str,
+                            detail_level: str, image: "torch.Tensor" = None, bypass_cache: bool = False,
+                            stream_mode: str = "关闭", en_only: bool = False) -> Tuple[str, str]:
+        """使用单个服务预设完成一次优化，返回 (优化后的提示词, 优化笔记)；失败时抛出异常"""
+        budget_settings = get_budget_settings(config)
+        prompt = shape_user_prompt(prompt, budget_settings)
+        service_type = config.get("type")
+        final_key = config.get("api_key")
+        api_url = config.get("api_base")
+        model = config.get("model")
         
-        style_en = style_map.get(style, 'General')
-        detail_en = detail_map.get(detail_level, 'Basic')
-
-        # --- 核心修正: 明确告知AI工作环境并禁止外部参数 ---
-        ecosystem_context = (
-            "You are an expert prompt engineer for the **ComfyUI / Stable Diffusion ecosystem**. "
-            "Your output will be used directly in these systems. "
-            "**Crucially, do NOT include any platform-specific parameters like `--ar`, `--v`, `--style`, etc.** "
-            "Focus only on the descriptive text part of the prompt."
-        )
-
-        if target_model == "Flux":
-            prompt_style_instructions = (
-                "You are generating a prompt for the **Flux model**. "
-                "This model excels at understanding natural, descriptive language. "
-                "Your task is to enhance the user's idea into a rich, descriptive prompt that works best for Flux."
-            )
-        elif target_model == "SDXL":
-            prompt_style_instructions = (
-                "You are generating a prompt for the **SDXL model**. "
-                "This model understands detailed descriptions and keyword-based prompts well. "
-                "Your task is to enhance the user's idea into a powerful and effective prompt that works best for SDXL."
-            )
-        else:
-             prompt_style_instructions = (
-                "You are generating a prompt for **general Stable Diffusion models (v1.5, etc.)**. "
-                "These models respond best to structured, keyword-rich prompts with clear tags. "
-                "Your task is to enhance the user's idea into a powerful and effective prompt in this style."
-            )
-
-        style_instruction = (
-            f"It is crucial that the new prompt strongly reflects the '{style_en}' artistic style. "
-            f"Infuse specific keywords, artist names, or descriptive phrases characteristic of the '{style_en}' style."
-        )
-        if style_en == "General":
-             style_instruction = "Your goal is to create a universally effective and detailed prompt."
-
-        return (
-            f"{ecosystem_context}\n\n"
-            "Your primary task is to take a user's basic idea and transform it into a highly effective prompt based on the user's chosen target model style."
-            f"{strict_instruction}\n\n"
-            "## Core Instructions\n"
-            f"{prompt_style_instructions}\n\n"
-            "## Task\n"
-            "1. Rewrite the user's idea into a prompt following all the Core Instructions for the chosen style.\n"
-            f"2. {style_instruction}\n"
-            f"3. The level of detail should be '{detail_en}'.\n"
-            "4. Provide the final English prompt and Chinese optimization notes in the required format."
-        )
+        temp_config = SERVICE_CONFIG.get(service_type, SERVICE_CONFIG["ChatGPT"]) 
+        temperature = temp_config["temperature_map"].get(detail_level, 0.5)
 
-    def refine_prompt(self, prompt: str, config_selection: str, target_model: str, strict_mode: bool, style: str, 
-                        detail_level: str, negative_mode: str, custom_negative: str, 
-                        image: torch.Tensor = None) -> Tuple[str, str, str]:
-        try:
-            config = self._get_config_details(config_selection)
-            service_type = config.get("type")
-            final_key = config.get("api_key")
-            api_url = config.get("api_base")
-            model = config.get("model")
+        headers = {"Content-Type": "application/json"}
+        payload = {}
+
+        if image is not None:
+            if service_type == "DeepSeek":
+                raise ValueError("DeepSeek 在此节点中当前不支持图片输入。请使用 Gemini 或 ChatGPT 进行视觉分析。")
+            print("🖼️ 检测到图片，切换到视觉分析模式。")
+            vision_settings = self._get_vision_settings(config)
+            mime_type = self.IMAGE_MIME_TYPES[vision_settings["format"]]
+            with stage("image_encode"):
+                base64_images = self._tensor_to_base64(image, vision_settings)
+            if len(base64_images) > 1:
+                print(f"🖼️ 检测到 {len(base64_images)} 张图片，将一并发送分析。")
             
-            temp_config = SERVICE_CONFIG.get(service_type, SERVICE_CONFIG["ChatGPT"]) 
-            temperature = temp_config["temperature_map"].get(detail_level, 0.5)
+            system_prompt_text, user_prompt_text = prompt_templates.vision_prompts(prompt, style, detail_level, strict_mode, target_model, en_only)
 
-            headers = {"Content-Type": "application/json"}
-            payload = {}
+            if service_type == "Gemini":
+                if "key=" not in api_url: api_url = f"{api_url}?key={final_key}"
+                final_user_text = f"{system_prompt_text}\n\n{user_prompt_text}"
+                image_parts = [{"inline_data": {"mime_type": mime_type, "data": data}} for data in base64_images]
+                payload = { "contents": [{"parts": [ {"text": final_user_text}, *image_parts ]}], "generationConfig": {"temperature": temperature} }
+            else:
+                headers["Authorization"] = f"Bearer {final_key}"
+                image_parts = [{"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{data}"}} for data in base64_images]
+                payload = { "model": model, "messages": [ {"role": "system", "content": system_prompt_text}, {"role": "user", "content": [ {"type": "text", "text": user_prompt_text}, *image_parts ]} ], "temperature": temperature }
+        else:
+            print("✍️ 未提供图片，在纯文本模式下运行。")
+            system_prompt_text = self._build_text_system_prompt(style, detail_level, strict_mode, target_model, en_only)
+            print(f"📝 系统提示词约 {estimate_tokens(system_prompt_text)} tokens。")
+            if service_type == "Gemini":
+                if "key=" not in api_url: api_url = f"{api_url}?key={final_key}"
+                payload = {"contents": [{"parts": [{"text": f"{system_prompt_text}\n\nUser idea: {prompt}"}]}], "generationConfig": {"temperature": temperature}}
+            else:
+                headers["Authorization"] = f"Bearer {final_key}"
+                payload = {"model": model, "messages": [{"role": "system", "content": system_prompt_text}, {"role": "user", "content": prompt}], "temperature": temperature}
 
-            if image is not None:
-                if service_type == "DeepSeek":
-                    raise ValueError("DeepSeek 在此节点中当前不支持图片输入。请使用 Gemini 或 ChatGPT 进行视觉分析。")
-                print("🖼️ 检测到图片，切换到视觉分析模式。")
-                base64_image = self._tensor_to_base64(image)
-                
-                style_map = self._get_style_map()
-                detail_map = {"基础": "Basic", "详细": "Detailed", "极其详细": "Ultra Detailed"}
-                style_en = style_map.get(style, 'General')
-                detail_en = detail_map.get(detail_level, 'Basic')
-
-                system_prompt_text = (
-                    "You are an expert in analyzing images and creating descriptive prompts for AI image generation within the **ComfyUI / Stable Diffusion ecosystem**. "
-                    "First, describe the provided image in detail. Then, use that description to generate a new, optimized prompt. "
-                    f"The prompt should be suitable for a '{target_model}' model. Follow its best practices. "
-                    "**Crucially, do NOT include any platform-specific parameters like `--ar`, `--v`, `--style`, etc.**"
-                )
-                user_prompt_text = f"Analyze the image, then create a new prompt. The desired art style is '{style_en}' and detail level is '{detail_en}'. User's additional instruction: '{prompt}'"
-                
-                strict_instruction = " Your entire response must strictly follow the format: [EN] english prompt [ZH] chinese optimization notes." if strict_mode else ""
-                user_prompt_text += f"\n\n{strict_instruction}"
+        request_tokens = apply_budget(service_type, payload, budget_settings, vision=image is not None, en_only=en_only)
 
-                if service_type == "Gemini":
-                    if "key=" not in api_url: api_url = f"{api_url}?key={final_key}"
-                    final_user_text = f"{system_prompt_text}\n\n{user_prompt_text}"
-                    payload = { "contents": [{"parts": [ {"text": final_user_text}, {"inline_data": {"mime_type": "image/jpeg", "data": base64_image}} ]}], "generationConfig": {"temperature": temperature} }
-                else:
-                    headers["Authorization"] = f"Bearer {final_key}"
-                    payload = { "model": model, "messages": [ {"role": "system", "content": system_prompt_text}, {"role": "user", "content": [ {"type": "text", "text": user_prompt_text}, {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}} ]} ], "temperature": temperature, "max_tokens": 2048 }
+        call_metrics = current_call()
+        if call_metrics is not None:
+            call_metrics.provider = config.get("name")
+
+        # 缓存键只包含服务类型、原始接口地址和完整请求体，不包含API密钥
+        cache_key = make_cache_key(service_type, config.get("api_base"), payload)
+        if not bypass_cache:
+            with stage("cache_lookup"):
+                cached = response_cache.get(cache_key)
+            if cached is not None:
+                print(f"📦 命中本地响应缓存，跳过API调用 ({response_cache.stats()})")
+                if call_metrics is not None:
+                    call_metrics.cache = "hit"
+                return (cached["optimized_prompt"], cached["notes"])
+            print(f"📦 本地响应缓存未命中 ({response_cache.stats()})")
+        if call_metrics is not None:
+            call_metrics.cache = "bypass" if bypass_cache else "miss"
+
+        def fetch() -> Tuple[str, str]:
+            response_complete, truncated = True, False
+            if stream_mode != "关闭":
+                stream_url, stream_payload = to_stream_request(service_type, api_url, payload)
+                with stage("payload_serialize"):
+                    body = json.dumps(stream_payload)
+                print(f"🚀 正在以流式模式调用 {service_type} API ({config.get('api_base')}，模型: {model})...")
+                with stage("http"):
+                    # 在发出请求前计时，首包耗时才包含建立连接和等待服务端响应的时间
+                    start_time = time.perf_counter()
+                    response = http_post(stream_url, config, headers=headers, data=body, stream=True, tokens=request_tokens)
+                    response.raise_for_status()
+                    recorded_tokens = call_metrics.tokens["total"] if call_metrics is not None else 0
+                    content, response_complete, truncated = read_stream(response, service_type, stop_at_zh=(stream_mode == "流式(仅提示词)"), start_time=start_time)
+                if call_metrics is not None and call_metrics.tokens["total"] == recorded_tokens:
+                    # 提前断开时 OpenAI 兼容接口还没有发送 usage，按本地规则估算
+                    call_metrics.add_tokens(estimate_payload_tokens(payload), estimate_tokens(content))
+                if truncated and not content.strip():
+                    raise ValueError(OUTPUT_CAP_ERROR)
             else:
-                print("✍️ 未提供图片，在纯文本模式下运行。")
-                system_prompt_text = self._build_text_system_prompt(style, detail_level, strict_mode, target_model)
-                if service_type == "Gemini":
-                    if "key=" not in api_url: api_url = f"{api_url}?key={final_key}"
-                    payload = {"contents": [{"parts": [{"text": f"{system_prompt_text}\n\nUser idea: {prompt}"}]}], "generationConfig": {"temperature": temperature}}
-                else:
-                    headers["Authorization"] = f"Bearer {final_key}"
-                    payload = {"model": model, "messages": [{"role": "system", "content": system_prompt_text}, {"role": "user", "content": prompt}], "temperature": temperature}
+                with stage("payload_serialize"):
+                    body = json.dumps(payload)
+                print(f"🚀 正在调用 {service_type} API ({api_url}，模型: {model})...")
+                with stage("http"):
+                    response = http_post(api_url, config, headers=headers, data=body, tokens=request_tokens)
+                    response.raise_for_status()
 
-            print(f"🚀 正在调用 {service_type} API ({api_url}，模型: {model})...")
-            response = requests.post(api_url, headers=headers, data=json.dumps(payload), timeout=180)
-            response.raise_for_status()
+                with stage("response_parse"):
+                    try:
+                        data = response.json()
+                    except ValueError:  # requests 的 JSONDecodeError 是 ValueError 的子类
+                        error_text = response.text
+                        print(f"❌ 解析JSON失败！服务器返回的不是有效的JSON格式。")
+                        print(f"👇 服务器原始响应内容: \n---\n{error_text}\n---")
+                        raise ValueError(f"服务器返回内容无法解析，请检查API地址或密钥是否正确。")
 
-            try:
-                data = response.json()
-            except requests.exceptions.JSONDecodeError:
-                error_text = response.text
-                print(f"❌ 解析JSON失败！服务器返回的不是有效的JSON格式。")
-                print(f"👇 服务器原始响应内容: \n---\n{error_text}\n---")
-                raise ValueError(f"服务器返回内容无法解析，请检查API地址或密钥是否正确。")
-
-            tokens_used_text = ""
-            if service_type in ["ChatGPT", "DeepSeek"]:
-                if 'usage' in data and 'total_tokens' in data['usage']:
-                    tokens_used_text = f"Tokens: {data['usage']['total_tokens']}. "
-                    print(f"🪙 Tokens 已使用: {data['usage']['total_tokens']}")
-            
-            content = data['candidates'][0]['content']['parts'][0]['text'] if service_type == "Gemini" else data['choices'][0]['message']['content']
-            
-            en_part_match = re.search(r"\[EN\](.*?)\[ZH\]", content, re.DOTALL)
+                    record_usage(service_type, data)
+                    content = response_text(data, service_type)
+                    truncated = finish_reason(data, service_type) in OUTPUT_CAP_REASONS
+        
+            if call_metrics is not None and call_metrics.tokens["total"]:
+                print(f"🪙 Tokens 已使用: {call_metrics.tokens['total']}")
+
+            # “仅提示词”模式或输出被截断时没有 [ZH] 标记，取 [EN] 之后的全部内容
+            en_part_match = re.search(r"\[EN\](.*?)(?:\[ZH\]|$)", content, re.DOTALL)
             optimized_prompt = clean_text(en_part_match.group(1)) if en_part_match else "⚠️ 解析优化后的提示词失败。检查AI是否返回了[EN]...[ZH]...格式。"
-            
+        
             optimization_notes = content
-            
-            negative_prompt_text = clean_text(custom_negative) if negative_mode == "自定义" else self.NEGATIVE_PROMPTS.get(negative_mode, "")
-            
-            print("🎉 提示词优化完成！")
-            return (optimized_prompt, negative_prompt_text, optimization_notes)
 
+            if not response_complete:
+                optimization_notes = f"{content}\nℹ️ 已在英文提示词完整后提前结束，未生成中文优化笔记。"
+            elif truncated:
+                print("⚠️ 响应达到输出上限被截断，结果不写入缓存。")
+            elif en_part_match:
+                # 解析失败的结果不缓存，下次调用重新请求
+                response_cache.put(cache_key, {"optimized_prompt": optimized_prompt, "notes": optimization_notes})
+            return (optimized_prompt, optimization_notes)
+
+        # 相同请求体的并发调用只发出一次请求；流式“仅提示词”模式的结果不同，单独合并
+        return single_flight.run(make_cache_key(cache_key, stream_mode), fetch, use_memo=not bypass_cache)
+
+    def _try_fast_path(self, config: dict, prompt: str, target_model: str, style: str, negative_prompt: str):
+        """本地规范化并评分，评分达到阈值时直接返回 (优化后的提示词, 优化笔记)，否则返回 None"""
+        settings = get_fast_path_settings(config)
+        with stage("fast_path"):
+            analysis = analyze_prompt(prompt, target_model, style, negative_prompt, int(settings["min_tags"]))
+        threshold = float(settings["threshold"])
+        if analysis.score < threshold:
+            print(f"⚡ 本地评分 {analysis.score:.2f} < {threshold:.2f}，交给AI改写。")
+            return None
+        print(f"⚡ 本地评分 {analysis.score:.2f} ≥ {threshold:.2f}，使用本地快速通道，跳过API调用。")
+        notes = [f"⚡ 已使用本地快速通道 (评分 {analysis.score:.2f} ≥ {threshold:.2f})，未调用AI。"]
+        notes += [f"- {note}" for note in analysis.notes]
+        return (analysis.prompt, "\n".join(notes))
+
+    def refine_prompt(self, prompt: str, config_selection: str, target_model: str, strict_mode: bool, style: str, 
+                        detail_level: str, negative_mode: str, custom_negative: str, 
+                        image: "torch.Tensor" = None, bypass_cache: bool = False,
+                        stream_mode: str = "关闭", output_mode: str = "提示词+笔记",
+                        fast_path: bool = False) -> Tuple[str, str, str, str]:
+        # 批量优化器的调用单独记为 AIPromptBatchRefiner，限速调度器按节点轮流放行
+        with track_call(type(self).__name__, config_selection) as call_metrics:
+            try:
+                with stage("config_lookup"):
+                    config = self._get_config_details(config_selection)
+                negative_prompt_text = clean_text(custom_negative) if negative_mode == "自定义" else self.NEGATIVE_PROMPTS.get(negative_mode, "")
+
+                # 图生文模式需要AI看图，不走快速通道
+                fast_result = None
+                if fast_path and image is None:
+                    fast_result = self._try_fast_path(config, prompt, target_model, style, negative_prompt_text)
+                    call_metrics.fast_path = fast_result is not None
+
+                def call(preset: dict) -> Tuple[str, str]:
+                    return self._refine_with_preset(preset, prompt, target_model, strict_mode, style, detail_level,
+                                                    image=image, bypass_cache=bypass_cache, stream_mode=stream_mode,
+                                                    en_only=(output_mode == "仅提示词"))
+
+                if fast_result is not None:
+                    optimized_prompt, optimization_notes = fast_result
+                elif is_routing_group(config):
+                    print(f"🧭 使用路由组 '{config_selection}'。")
+                    optimized_prompt, optimization_notes = run_routed(config, call)
+                else:
+                    optimized_prompt, optimization_notes = call(config)
+                
+                print("🎉 提示词优化完成！")
+                result = (optimized_prompt, negative_prompt_text, optimization_notes)
+
+            except Exception as e:
+                call_metrics.status = "error"
+                error_msg = f"❌ 发生错误: {str(e)}"
+                print(error_msg)
+                result = (prompt, "", error_msg)
+        return result + (call_metrics.to_json(),)
+
+    async def refine_prompt_async(self, *args, **kwargs) -> Tuple[str, str, str, str]:
+        return await run_in_background(self.refine_prompt, *args, **kwargs)
+
+class AIPromptBatchRefiner(AIPromptRefiner):
+    """
+    批量优化多个提示词：每行一个提示词，在有限大小的线程池中并发调用API，
+    按输入顺序返回列表结果，单个提示词失败不会中断整个批次。
+    """
+
+    DEFAULT_BATCH_SETTINGS = {"concurrency": 4, "rpm": 0}
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        inputs = super().INPUT_TYPES()
+        required = dict(inputs["required"])
+        required["prompt"] = ("STRING", {"multiline": True, "default": "a cute cat\na lonely lighthouse", "tooltip": "每行一个提示词，空行会被忽略。"})
+        return {
+            "required": required,
+            "optional": {
+                "prompts_file": ("STRING", {"default": "", "tooltip": "(可选) 文本文件路径，文件中每行一个提示词，会追加在上方提示词之后。"}),
+                "bypass_cache": inputs["optional"]["bypass_cache"],
+                "stream_mode": inputs["optional"]["stream_mode"],
+                "output_mode": inputs["optional"]["output_mode"],
+                "fast_path": inputs["optional"]["fast_path"],
+            }
+        }
+
+    OUTPUT_IS_LIST = (True, True, True, True)
+    FUNCTION = select_function("refine_batch", "refine_batch_async")
+    PREFETCH_FUNCTION = "refine_batch"
+
+    def _collect_prompts(self, prompt: str, prompts_file: str) -> List[str]:
+        lines = prompt.splitlines()
+        if prompts_file.strip():
+            path = os.path.expanduser(prompts_file.strip())
+            if not os.path.isfile(path):
+                raise ValueError(f"找不到提示词文件: {path}")
+            with open(path, 'r', encoding='utf-8') as f:
+                lines += f.read().splitlines()
+        return [line.strip() for line in lines if line.strip()]
+
+    def _get_batch_settings(self, config_selection: str) -> dict:
+        settings = dict(self.DEFAULT_BATCH_SETTINGS)
+        try:
+            config = self._get_config_details(config_selection)
+            if isinstance(config.get("batch"), dict):
+                settings.update(config["batch"])
+        except ValueError:
+            pass  # 找不到配置时由每个提示词各自返回错误
+        return settings
+
+    def refine_batch(self, prompt: str, config_selection: str, target_model: str, strict_mode: bool, style: str,
+                     detail_level: str, negative_mode: str, custom_negative: str,
+                     prompts_file: str = "", bypass_cache: bool = False,
+                     stream_mode: str = "关闭", output_mode: str = "提示词+笔记",
+                     fast_path: bool = False) -> Tuple[List[str], List[str], List[str], List[str]]:
+        try:
+            prompts = self._collect_prompts(prompt, prompts_file)
         except Exception as e:
             error_msg = f"❌ 发生错误: {str(e)}"
             print(error_msg)
-            return (prompt, "", error_msg)
+            return ([prompt], [""], [error_msg], [json.dumps({"status": "error"})])
+        if not prompts:
+            return ([], [], [], [])
+
+        settings = self._get_batch_settings(config_selection)
+        workers = max(1, min(int(settings["concurrency"]), len(prompts)))
+        limiter = RateLimiter(settings["rpm"])
+        print(f"📚 批量模式: 共 {len(prompts)} 个提示词，并发数 {workers}，每分钟请求上限 {settings['rpm'] or '不限'}。")
+
+        def run_one(item: str) -> Tuple[str, str, str, str]:
+            limiter.wait()
+            return self.refine_prompt(item, config_selection, target_model, strict_mode, style, detail_level,
+                                      negative_mode, custom_negative, bypass_cache=bypass_cache,
+                                      stream_mode=stream_mode, output_mode=output_mode, fast_path=fast_path)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run_one, prompts))
+
+        failed = sum(1 for _, _, notes, _ in results if notes.startswith("❌"))
+        print(f"📚 批量优化完成: 成功 {len(results) - failed} 个，失败 {failed} 个。")
+        return tuple(list(column) for column in zip(*results))
+
+    async def refine_batch_async(self, *args, **kwargs) -> Tuple[List[str], List[str], List[str], List[str]]:
+        return await run_in_background(self.refine_batch, *args, **kwargs)
 
-NODE_CLASS_MAPPINGS = { "AIPromptRefiner": AIPromptRefiner }
-NODE_DISPLAY_NAME_MAPPINGS = { "AIPromptRefiner": "AI提示词优化器" }
+NODE_CLASS_MAPPINGS = { "AIPromptRefiner": AIPromptRefiner, "AIPromptBatchRefiner": AIPromptBatchRefiner }
+NODE_DISPLAY_NAME_MAPPINGS = { "AIPromptRefiner": "AI提示词优化器", "AIPromptBatchRefiner": "AI提示词批量优化器" }
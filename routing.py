@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .common import get_preset, ROUTING_GROUP_TYPE
+
+# 遇到这些状态码时在同一服务上退避重试，其他错误直接切换到下一个服务
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+DEFAULT_ROUTING_SETTINGS = {
+    "retries": 2,             # 每个服务的最大重试次数
+    "backoff": 1.0,           # 首次重试等待(秒)，之后每次翻倍
+    "max_backoff": 30.0,      # 单次重试最长等待(秒)
+    "hedge": False,           # 是否启用对冲请求
+    "hedge_percentile": 0.9,  # 超过该分位延迟仍未返回时，同时请求下一个服务
+    "hedge_delay": 5.0,       # 延迟样本不足时使用的对冲等待(秒)
+    "failure_threshold": 3,   # 连续失败多少次后熔断
+    "cooldown": 60.0,         # 熔断持续时间(秒)
+}
+
+LATENCY_WINDOW = 50
+MIN_LATENCY_SAMPLES = 5
+
+
+class CircuitBreaker:
+    """按服务名称记录连续失败次数，失败过多时在冷却期内跳过该服务"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._opened_at = {}
+
+    def allow(self, name: str, cooldown: float) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(name)
+            # 冷却期结束后放行一次试探请求
+            return opened_at is None or time.monotonic() - opened_at >= cooldown
+
+    def record_success(self, name: str) -> None:
+        with self._lock:
+            self._failures.pop(name, None)
+            self._opened_at.pop(name, None)
+
+    def record_failure(self, name: str, threshold: int) -> None:
+        with self._lock:
+            self._failures[name] = self._failures.get(name, 0) + 1
+            if self._failures[name] >= threshold:
+                if name not in self._opened_at:
+                    print(f"🔌 服务 '{name}' 连续失败 {self._failures[name]} 次，暂时熔断。")
+                self._opened_at[name] = time.monotonic()
+
+
+class LatencyTracker:
+    """记录每个服务最近的成功请求耗时，用于计算对冲等待时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def percentile(self, name: str, q: float):
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+circuit_breaker = CircuitBreaker()
+latency_tracker = LatencyTracker()
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ai-prompt-hedge")
+
+
+def is_routing_group(config: dict) -> bool:
+    return config.get("type") == ROUTING_GROUP_TYPE
+
+
+def get_routing_settings(group: dict) -> dict:
+    settings = dict(DEFAULT_ROUTING_SETTINGS)
+    settings.update({key: group[key] for key in DEFAULT_ROUTING_SETTINGS if key in group})
+    return settings
+
+
+def _status_code(exc: Exception):
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    # 出现异常时 requests 已经由 transport 加载，这里导入不会增加启动时间
+    import requests
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS
+
+
+def _is_provider_failure(exc: Exception) -> bool:
+    """只有连接/超时错误和 429/5xx 才说明服务本身出了问题；本地校验错误不计入熔断"""
+    import requests
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    status = _status_code(exc)
+    return status is not None and (status in RETRYABLE_STATUS or status >= 500)
+
+
+def call_with_retries(member: dict, call, settings: dict):
+    """在单个服务上调用，遇到 429/5xx 或连接错误时指数退避重试"""
+    name = member["name"]
+    attempt = 0
+    while True:
+        start_time = time.perf_counter()
+        try:
+            result = call(member)
+        except Exception as e:
+            if attempt < int(settings["retries"]) and _is_retryable(e):
+                delay = min(float(settings["backoff"]) * (2 ** attempt), float(settings["max_backoff"]))
+                if _status_code(e) == 429:
+                    # 限速调度器已按 Retry-After 暂停该服务，直接重新排队即可
+                    delay = 0.0
+                attempt += 1
+                print(f"🔁 服务 '{name}' 返回 {_status_code(e) or type(e).__name__}，{delay:.1f} 秒后第 {attempt} 次重试...")
+                time.sleep(delay)
+                continue
+            if _is_provider_failure(e):
+                circuit_breaker.record_failure(name, int(settings["failure_threshold"]))
+            raise
+        latency_tracker.record(name, time.perf_counter() - start_time)
+        circuit_breaker.record_success(name)
+        return result
+
+
+def _resolve_members(group: dict, settings: dict) -> list:
+    members = []
+    for name in group.get("members", []):
+        member = get_preset(name)
+        if member is None:
+            print(f"⚠️ 路由组 '{group['name']}' 中的服务 '{name}' 不存在，已跳过。")
+        elif is_routing_group(member):
+            print(f"⚠️ 路由组不能嵌套，已跳过 '{name}'。")
+        elif not circuit_breaker.allow(name, float(settings["cooldown"])):
+            print(f"🔌 服务 '{name}' 处于熔断状态，已跳过。")
+        else:
+            members.append(member)
+    return members
+
+
+def _hedge_delay(member: dict, settings: dict) -> float:
+    observed = latency_tracker.percentile(member["name"], float(settings["hedge_percentile"]))
+    return observed if observed is not None else float(settings["hedge_delay"])
+
+
+def run_routed(group: dict, call):
+    """
+    按顺序在路由组的各个服务上执行 call(member)，返回第一个成功的结果。
+    开启对冲时，若当前服务超过其历史分位延迟仍未返回，会同时请求下一个服务。
+    """
+    settings = get_routing_settings(group)
+    queue = _resolve_members(group, settings)
+    if not queue:
+        raise ValueError(f"路由组 '{group['name']}' 中没有可用的服务。")
+
+    errors = []
+    if not settings["hedge"]:
+        for member in queue:
+            try:
+                return call_with_retries(member, call, settings)
+            except Exception as e:
+                print(f"↪️ 服务 '{member['name']}' 失败: {e}，尝试下一个服务。")
+                errors.append(f"{member['name']}: {e}")
+        raise RuntimeError(f"路由组 '{group['name']}' 中的所有服务均失败 ({'; '.join(errors)})")
+
+    pending = {}
+
+    def launch():
+        member = queue.pop(0)
+        # 复制上下文，使对冲线程中的请求也计入当前调用的性能指标
+        context = contextvars.copy_context()
+        pending[_hedge_executor.submit(context.run, call_with_retries, member, call, settings)] = member
+
+    launch()
+    while pending:
+        # 只有还有备用服务时才需要设置对冲等待
+        timeout = min(_hedge_delay(member, settings) for member in pending.values()) if queue else None
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            print(f"⏱️ 等待超过 {timeout:.1f} 秒，对冲请求下一个服务 '{queue[0]['name']}'。")
+            launch()
+            continue
+        for future in done:
+            member = pending.pop(future)
+            try:
+                return future.result()
+            except Exception as e:
+                print(f"↪️ 服务 '{member['name']}' 失败: {e}")
+                errors.append(f"{member['name']}: {e}")
+        if not pending and queue:
+            launch()
+    raise RuntimeError(f"路由组 '{group['name']}' 中的所有服务均失败 ({'; '.join(errors)})")
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+
+from .common import get_config_section
+from .metrics import current_call, record_stage
+
+# 默认不限速；可在预设的 "limits" 字段或 config.json 顶层的 "rate_limits" 字段中按服务名称设置
+DEFAULT_LIMITS = {
+    "rpm": 0,       # 每分钟请求数上限，0 表示不限
+    "tpm": 0,       # 每分钟 token 数上限(按本地估算)，0 表示不限
+    "burst": 0,     # 令牌桶容量，0 表示按 10 秒的额度计算
+    "retries": 2,   # 收到 429 后在调度器内重新排队的次数
+}
+# 免费翻译接口容易被封禁，默认限制发送速度
+DEFAULT_SERVICE_LIMITS = {
+    "Google Translate": {"rpm": 120},
+    "MyMemory Translate": {"rpm": 30},
+}
+THROTTLE_STATUS = {429, 503}
+MIN_RATE_FACTOR = 0.1
+MAX_BACKOFF_SECONDS = 60.0
+OBSERVE_WINDOW_SECONDS = 60.0
+# 样本太少时无法可靠估算服务允许的速度，只按 Retry-After 和指数退避暂停
+MIN_LEARN_SAMPLES = 10
+MIN_LEARN_SECONDS = 10.0
+
+
+def get_rate_limits(config: dict) -> dict:
+    """合并默认值、"rate_limits" 中同名服务的设置和预设自身的 "limits" 字段"""
+    name = config.get("name")
+    limits = dict(DEFAULT_LIMITS)
+    limits.update(DEFAULT_SERVICE_LIMITS.get(name, {}))
+    section = get_config_section("rate_limits")
+    if isinstance(section, dict) and isinstance(section.get(name), dict):
+        limits.update(section[name])
+    if isinstance(config.get("limits"), dict):
+        limits.update(config["limits"])
+    return limits
+
+
+def parse_retry_after(value):
+    """Retry-After 可以是秒数或 HTTP 日期，无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """按每分钟额度匀速补充的令牌桶；单次消耗可以超过容量，超出部分记为欠额"""
+
+    def __init__(self, per_minute: float, capacity: float):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, factor: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * factor)
+        self.updated = now
+
+    def wait_time(self, amount: float, factor: float) -> float:
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / (self.rate * factor)
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+
+class ProviderQueue:
+    """
+    单个服务的发送队列：按节点分别排队、轮流放行，避免批量任务占满额度；
+    收到 429 后按 Retry-After 暂停，并把发送速度减半，之后随成功请求逐步恢复。
+    未设置 rpm 的服务按收到 429 前实际测得的发送速度作为临时上限，恢复到 100% 后取消；
+    发送记录不足以估算速度时(例如刚启动)，只按 Retry-After 和指数退避暂停。
+    """
+
+    def __init__(self, name: str, limits: dict):
+        self.name = name
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()
+        self._limits = None
+        self._request_bucket = None
+        self._token_bucket = None
+        self.blocked_until = 0.0
+        self.rate_factor = 1.0
+        self.consecutive_throttles = 0
+        self._learned = False
+        self._sent = deque()
+        self.configure(limits)
+
+    def configure(self, limits: dict) -> None:
+        """配置变化时重建令牌桶"""
+        with self._cond:
+            if limits == self._limits:
+                return
+            self._limits = dict(limits)
+            self._learned = False
+            self._request_bucket = self._make_bucket(float(limits["rpm"] or 0), float(limits["burst"] or 0))
+            self._token_bucket = self._make_bucket(float(limits["tpm"] or 0), 0.0)
+
+    @staticmethod
+    def _make_bucket(per_minute: float, burst: float):
+        if per_minute <= 0:
+            return None
+        return TokenBucket(per_minute, burst or max(1.0, per_minute / 6))
+
+    @property
+    def limited(self) -> bool:
+        return self._request_bucket is not None or self._token_bucket is not None
+
+    def _delay(self, now: float, tokens: int) -> float:
+        delay = max(0.0, self.blocked_until - now)
+        for bucket, amount in ((self._request_bucket, 1), (self._token_bucket, tokens)):
+            if bucket is not None and amount:
+                bucket.refill(now, self.rate_factor)
+                delay = max(delay, bucket.wait_time(amount, self.rate_factor))
+        return delay
+
+    def acquire(self, node: str, tokens: int = 0) -> float:
+        """阻塞到轮到该节点且额度足够为止，返回等待的秒数"""
+        start = time.monotonic()
+        with self._cond:
+            if not self._queues and self._delay(start, tokens) <= 0:
+                self._take(tokens)
+                return 0.0
+            ticket = object()
+            self._queues.setdefault(node, deque()).append(ticket)
+            try:
+                while True:
+                    head_node = next(iter(self._queues))
+                    if self._queues[head_node][0] is ticket:
+                        delay = self._delay(time.monotonic(), tokens)
+                        if delay <= 0:
+                            self._take(tokens)
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+            finally:
+                queue = self._queues[node]
+                queue.remove(ticket)
+                # 轮转: 放行一个请求后，该节点排到队尾
+                if queue:
+                    self._queues.move_to_end(node)
+                else:
+                    del self._queues[node]
+                self._cond.notify_all()
+        return time.monotonic() - start
+
+    def _take(self, tokens: int) -> None:
+        if self._request_bucket is not None:
+            self._request_bucket.take(1)
+        if self._request_bucket is None or self._learned:
+            # 没有声明 rpm 时记录最近的发送时间，用于在限流时估算服务实际允许的速度
+            now = time.monotonic()
+            self._sent.append(now)
+            while self._sent and now - self._sent[0] > OBSERVE_WINDOW_SECONDS:
+                self._sent.popleft()
+        if self._token_bucket is not None and tokens:
+            self._token_bucket.take(tokens)
+
+    def on_throttled(self, retry_after) -> float:
+        """记录一次限流响应，返回需要暂停的秒数"""
+        with self._cond:
+            self.consecutive_throttles += 1
+            if retry_after is None:
+                retry_after = min(MAX_BACKOFF_SECONDS, 2.0 ** (self.consecutive_throttles - 1))
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            if self._request_bucket is None:
+                self._learn_rate(now)
+            if self.limited:
+                self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor * 0.5)
+            self._cond.notify_all()
+        return retry_after
+
+    def _learn_rate(self, now: float) -> None:
+        """按最近一分钟内实际经过的时间计算发送速度，作为该服务的每分钟请求数上限"""
+        while self._sent and now - self._sent[0] > OBSERVE_WINDOW_SECONDS:
+            self._sent.popleft()
+        elapsed = now - self._sent[0] if self._sent else 0.0
+        if len(self._sent) < MIN_LEARN_SAMPLES or elapsed < MIN_LEARN_SECONDS:
+            return
+        observed_rpm = len(self._sent) / elapsed * 60.0
+        bucket = self._make_bucket(observed_rpm, 0.0)
+        # 桶从空开始，暂停结束后按学习到的速度匀速放行
+        bucket.level = 0.0
+        self._request_bucket = bucket
+        self._learned = True
+        print(f"🚦 服务 '{self.name}' 未设置 rpm，按最近发送速度将上限设为每分钟 {observed_rpm:.0f} 次。")
+
+    def on_success(self) -> None:
+        with self._cond:
+            self.consecutive_throttles = 0
+            if self.rate_factor < 1.0:
+                self.rate_factor = min(1.0, self.rate_factor + 0.05)
+                if self.rate_factor >= 1.0 and self._learned:
+                    # 已恢复到学习到的速度且不再限流，取消临时上限以便重新探测
+                    self._request_bucket = None
+                    self._learned = False
+
+
+class RequestScheduler:
+    """所有节点共享的调度器，每个服务(预设名称或主机)一个发送队列"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._providers = {}
+
+    def queue_for(self, name: str, limits: dict) -> ProviderQueue:
+        with self._lock:
+            provider = self._providers.get(name)
+            if provider is None:
+                provider = self._providers[name] = ProviderQueue(name, limits)
+                return provider
+        provider.configure(limits)
+        return provider
+
+    def send(self, name: str, config: dict, tokens: int, request):
+        """
+        在额度允许时调用 request() 发送请求；收到 429 (或带 Retry-After 的 503) 时
+        暂停该服务并重新排队，重试次数用完后返回最后一次的响应。
+        """
+        limits = get_rate_limits(config)
+        provider = self.queue_for(name, limits)
+        call_metrics = current_call()
+        node = call_metrics.node if call_metrics is not None else "default"
+        attempt = 0
+        while True:
+            waited = provider.acquire(node, tokens)
+            if waited > 0:
+                record_stage("rate_limit_wait", waited)
+            response = request()
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            throttled = response.status_code == 429 or (response.status_code in THROTTLE_STATUS and retry_after is not None)
+            if not throttled:
+                provider.on_success()
+                return response
+            pause = provider.on_throttled(retry_after)
+            if attempt >= int(limits["retries"]):
+                return response
+            attempt += 1
+            rate_note = f"，发送速度降至 {provider.rate_factor:.0%}" if provider.limited else ""
+            print(f"🚦 服务 '{name}' 返回 {response.status_code}，暂停 {pause:.1f} 秒后重新排队 (第 {attempt} 次){rate_note}。")
+            response.close()
+
+
+scheduler = RequestScheduler()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+from .common import get_config_section
+from .metrics import current_call
+
+# 默认开启；可在 config.json 的 "single_flight" 字段中调整
+DEFAULT_SINGLE_FLIGHT_SETTINGS = {
+    "enabled": True,
+    "memo_seconds": 10,  # 请求完成后，相同请求在该时间内直接复用结果；0 表示只合并进行中的请求
+}
+
+
+def get_single_flight_settings() -> dict:
+    settings = dict(DEFAULT_SINGLE_FLIGHT_SETTINGS)
+    section = get_config_section("single_flight")
+    if isinstance(section, dict):
+        settings.update(section)
+    return settings
+
+
+class _Flight:
+    """一次进行中的请求，等待者在 done 上阻塞，完成后共享 result 或 error"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    合并相同的并发请求：同一个键同时只有一个请求真正发出，
+    其他调用等待它完成后共享结果或异常；成功的结果还会在短时间内被复用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._memo = {}
+
+    def _prune(self, now: float) -> None:
+        for key in [key for key, (expires, _) in self._memo.items() if expires <= now]:
+            del self._memo[key]
+
+    def run(self, key: str, fn, use_memo: bool = True):
+        settings = get_single_flight_settings()
+        if not settings["enabled"]:
+            return fn()
+
+        with self._lock:
+            memo = self._memo.get(key) if use_memo else None
+            if memo is not None and memo[0] > time.monotonic():
+                self._mark_shared("♻️ 相同请求刚刚完成，直接复用其结果。")
+                return memo[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self._mark_shared("🔗 已有相同的请求正在进行，等待并共享其结果。")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                memo_seconds = float(settings["memo_seconds"] or 0)
+                if flight.error is None and memo_seconds > 0:
+                    now = time.monotonic()
+                    self._prune(now)
+                    self._memo[key] = (now + memo_seconds, flight.result)
+            flight.done.set()
+
+    def _mark_shared(self, message: str) -> None:
+        print(message)
+        call_metrics = current_call()
+        if call_metrics is not None:
+            call_metrics.coalesced = True
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+from typing import Iterator, Tuple
+
+from .metrics import record_response_bytes, record_usage
+
+# 英文提示词在 [EN] 和 [ZH] 之间，看到 [ZH] 即说明提示词部分已经完整
+EN_MARKER = "[EN]"
+ZH_MARKER = "[ZH]"
+# 因达到输出上限而被截断时，OpenAI 兼容接口返回 "length"，Gemini 返回 "MAX_TOKENS"
+OUTPUT_CAP_REASONS = {"length", "MAX_TOKENS"}
+OUTPUT_CAP_ERROR = "模型达到输出上限，没有返回任何文本。思考模型的思考 token 也计入输出上限，请在预设的 budget 中调大输出上限或设为 0。"
+
+
+def finish_reason(data: dict, service_type: str):
+    """读取普通响应或流式事件中的结束原因，没有时返回 None"""
+    try:
+        if service_type == "Gemini":
+            return data["candidates"][0].get("finishReason")
+        return data["choices"][0].get("finish_reason")
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return None
+
+
+def response_text(data: dict, service_type: str) -> str:
+    """读取普通响应中的文本；达到输出上限而没有任何文本时给出明确的错误"""
+    try:
+        if service_type == "Gemini":
+            return "".join(part.get("text", "") for part in data["candidates"][0]["content"]["parts"])
+        return data["choices"][0]["message"]["content"] or ""
+    except (KeyError, IndexError, TypeError, AttributeError):
+        reason = finish_reason(data, service_type)
+        if reason in OUTPUT_CAP_REASONS:
+            raise ValueError(OUTPUT_CAP_ERROR)
+        raise ValueError(f"{service_type} 响应中没有文本内容 (结束原因: {reason or '未知'})。")
+
+
+def to_stream_request(service_type: str, api_url: str, payload: dict) -> Tuple[str, dict]:
+    """把普通请求转换为对应服务的流式(SSE)请求；OpenAI 兼容接口需要显式要求在最后一个事件中返回 usage"""
+    if service_type == "Gemini":
+        stream_url = api_url.replace(":generateContent", ":streamGenerateContent")
+        stream_url += "&alt=sse" if "?" in stream_url else "?alt=sse"
+        return stream_url, payload
+    return api_url, {**payload, "stream": True, "stream_options": {"include_usage": True}}
+
+
+def iter_sse_text(response, service_type: str, state: dict = None) -> Iterator[str]:
+    """
+    逐个解析SSE事件，返回每个事件中新增的文本片段；
+    结束原因写入 state["finish_reason"]，最近一个带 token 用量的事件写入 state["usage"]。
+    """
+    # SSE 响应通常不声明字符集，按行自行以 UTF-8 解码，避免中文乱码
+    for raw_line in response.iter_lines():
+        record_response_bytes(len(raw_line) + 1)
+        line = raw_line.decode("utf-8", errors="replace") if isinstance(raw_line, bytes) else raw_line
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        try:
+            event = json.loads(data)
+        except ValueError:
+            continue
+        reason = finish_reason(event, service_type)
+        if reason and state is not None:
+            state["finish_reason"] = reason
+        # Gemini 每个事件的 usageMetadata 都是累计值；OpenAI 只在 choices 为空的最后一个事件中返回 usage
+        if state is not None and isinstance(event, dict) and event.get("usageMetadata" if service_type == "Gemini" else "usage"):
+            state["usage"] = event
+        try:
+            if service_type == "Gemini":
+                text = "".join(part.get("text", "") for part in event["candidates"][0]["content"]["parts"])
+            else:
+                text = event["choices"][0]["delta"].get("content") or ""
+        except (KeyError, IndexError, TypeError):
+            continue
+        if text:
+            yield text
+
+
+def read_stream(response, service_type: str, stop_at_zh: bool = False, start_time: float = None) -> Tuple[str, bool, bool]:
+    """
+    读取流式响应并拼接完整内容。
+    返回 (内容, 是否读取完整, 是否因输出上限被截断)；stop_at_zh 为 True 时，一旦英文提示词完整就关闭连接。
+    start_time 为发出请求时的 time.perf_counter()，未提供时从开始读取时计时。
+    """
+    if start_time is None:
+        start_time = time.perf_counter()
+    chunks = []
+    prompt_ready = False
+    state = {}
+    try:
+        for text in iter_sse_text(response, service_type, state):
+            if not chunks:
+                print(f"⏱️ 首个数据块耗时 {time.perf_counter() - start_time:.2f} 秒")
+            chunks.append(text)
+            if not prompt_ready:
+                content = "".join(chunks)
+                if EN_MARKER in content and ZH_MARKER in content[content.index(EN_MARKER):]:
+                    prompt_ready = True
+                    print(f"⏱️ 首个可用提示词耗时 {time.perf_counter() - start_time:.2f} 秒")
+                    if stop_at_zh:
+                        return content, False, False
+    finally:
+        response.close()
+        # 提前断开时只能记录已收到的用量
+        record_usage(service_type, state.get("usage"))
+    print(f"⏱️ 流式响应总耗时 {time.perf_counter() - start_time:.2f} 秒")
+    return "".join(chunks), True, state.get("finish_reason") in OUTPUT_CAP_REASONS
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import threading
+from itertools import product
+
+from .common import PLUGIN_ROOT, get_config_section, estimate_tokens
+
+# 可选的模板覆盖文件；config.json 中的 "templates" 字段优先级更高
+TEMPLATES_PATH = os.path.join(PLUGIN_ROOT, "templates.json")
+
+STYLE_MAP = {
+    "通用": "General", "摄影": "Photographic", "写实": "Realistic", "动漫": "Anime", "3D模型": "3D Model", 
+    "电影感": "Cinematic", "概念艺术": "Concept Art", "建筑设计": "Architectural", "奇幻": "Fantasy", 
+    "赛博朋克": "Cyberpunk", "蒸汽朋克": "Steampunk", "水墨画": "Ink Wash Painting", "油画": "Oil Painting", 
+    "水彩画": "Watercolor", "素描": "Sketch", "像素艺术": "Pixel Art", "低多边形": "Low Poly", 
+    "简约": "Minimalist", "复古": "Vintage"
+}
+DETAIL_MAP = {"基础": "Basic", "详细": "Detailed", "极其详细": "Ultra Detailed"}
+TARGET_MODELS = ["通用", "SDXL", "Flux"]
+
+DEFAULT_TEMPLATES = {
+    # --- 核心修正: 明确告知AI工作环境并禁止外部参数 ---
+    "ecosystem_context": (
+        "You are an expert prompt engineer for the **ComfyUI / Stable Diffusion ecosystem**. "
+        "Your output will be used directly in these systems. "
+        "**Crucially, do NOT include any platform-specific parameters like `--ar`, `--v`, `--style`, etc.** "
+        "Focus only on the descriptive text part of the prompt."
+    ),
+    "model_instructions": {
+        "Flux": (
+            "You are generating a prompt for the **Flux model**. "
+            "This model excels at understanding natural, descriptive language. "
+            "Your task is to enhance the user's idea into a rich, descriptive prompt that works best for Flux."
+        ),
+        "SDXL": (
+            "You are generating a prompt for the **SDXL model**. "
+            "This model understands detailed descriptions and keyword-based prompts well. "
+            "Your task is to enhance the user's idea into a powerful and effective prompt that works best for SDXL."
+        ),
+        "通用": (
+            "You are generating a prompt for **general Stable Diffusion models (v1.5, etc.)**. "
+            "These models respond best to structured, keyword-rich prompts with clear tags. "
+            "Your task is to enhance the user's idea into a powerful and effective prompt in this style."
+        ),
+    },
+    "style_instruction": (
+        "It is crucial that the new prompt strongly reflects the '{style_en}' artistic style. "
+        "Infuse specific keywords, artist names, or descriptive phrases characteristic of the '{style_en}' style."
+    ),
+    "general_style_instruction": "Your goal is to create a universally effective and detailed prompt.",
+    "strict_instruction": " Your entire response must strictly follow the format: [EN] english prompt [ZH] chinese optimization notes.",
+    # “仅提示词”输出模式不再请求中文优化笔记，以减少输出 token
+    "en_only_instruction": " Your entire response must strictly follow the format: [EN] english prompt. Do not add notes, explanations or any other text.",
+    "output_instruction": "Provide the final English prompt and Chinese optimization notes in the required format.",
+    "en_only_output_instruction": "Provide only the final English prompt in the required format.",
+    "text_system": (
+        "{ecosystem_context}\n\n"
+        "Your primary task is to take a user's basic idea and transform it into a highly effective prompt based on the user's chosen target model style."
+        "{strict_instruction}\n\n"
+        "## Core Instructions\n"
+        "{model_instruction}\n\n"
+        "## Task\n"
+        "1. Rewrite the user's idea into a prompt following all the Core Instructions for the chosen style.\n"
+        "2. {style_instruction}\n"
+        "3. The level of detail should be '{detail_en}'.\n"
+        "4. {output_instruction}"
+    ),
+    "vision_system": (
+        "You are an expert in analyzing images and creating descriptive prompts for AI image generation within the **ComfyUI / Stable Diffusion ecosystem**. "
+        "First, describe the provided image in detail. Then, use that description to generate a new, optimized prompt. "
+        "The prompt should be suitable for a '{target_model}' model. Follow its best practices. "
+        "**Crucially, do NOT include any platform-specific parameters like `--ar`, `--v`, `--style`, etc.**"
+    ),
+    "vision_user": "Analyze the image, then create a new prompt. The desired art style is '{style_en}' and detail level is '{detail_en}'. User's additional instruction: '{prompt}'",
+}
+
+
+class PromptTemplateRegistry:
+    """
+    系统提示词模板注册表。
+    首次使用时预编译所有 (风格 × 细节 × 规范输出 × 目标模型 × 仅提示词) 组合，
+    模板覆盖内容变化后自动重新编译。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signature = None
+        self._templates = DEFAULT_TEMPLATES
+        self._text_prompts = {}
+        self._vision_prompts = {}
+        self._file_signature = None
+        self._file_overrides = {}
+
+    def _read_templates_file(self) -> dict:
+        """templates.json 同样只在修改时间或大小变化时重新解析"""
+        try:
+            stat = os.stat(TEMPLATES_PATH)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if signature != self._file_signature:
+            self._file_overrides = {}
+            if signature is not None:
+                try:
+                    with open(TEMPLATES_PATH, 'r', encoding='utf-8') as f:
+                        self._file_overrides = json.load(f)
+                except Exception as e:
+                    print(f"❌ 加载 templates.json 文件时发生错误: {e}")
+            self._file_signature = signature
+        return self._file_overrides
+
+    def _load_overrides(self) -> dict:
+        overrides = dict(self._read_templates_file())
+        section = get_config_section("templates")
+        if isinstance(section, dict):
+            overrides.update(section)
+        return overrides
+
+    def _merge(self, overrides: dict) -> dict:
+        templates = dict(DEFAULT_TEMPLATES)
+        for key, value in overrides.items():
+            if key not in DEFAULT_TEMPLATES:
+                print(f"⚠️ 未知的模板名称 '{key}'，已忽略。")
+            elif key == "model_instructions" and isinstance(value, dict):
+                templates[key] = {**DEFAULT_TEMPLATES[key], **value}
+            elif isinstance(value, str):
+                templates[key] = value
+        return templates
+
+    def _format_instruction(self, templates: dict, strict_mode: bool, en_only: bool) -> str:
+        # 仅提示词模式依赖 [EN] 标记解析结果，因此总是要求固定格式
+        if en_only:
+            return templates["en_only_instruction"]
+        return templates["strict_instruction"] if strict_mode else ""
+
+    def _compile_text_prompt(self, templates: dict, style: str, detail_level: str, strict_mode: bool, target_model: str,
+                             en_only: bool = False) -> str:
+        style_en = STYLE_MAP.get(style, 'General')
+        if style_en == "General":
+            style_instruction = templates["general_style_instruction"]
+        else:
+            style_instruction = templates["style_instruction"].format(style_en=style_en)
+        model_instructions = templates["model_instructions"]
+        return templates["text_system"].format(
+            ecosystem_context=templates["ecosystem_context"],
+            strict_instruction=self._format_instruction(templates, strict_mode, en_only),
+            output_instruction=templates["en_only_output_instruction" if en_only else "output_instruction"],
+            model_instruction=model_instructions.get(target_model, model_instructions["通用"]),
+            style_instruction=style_instruction,
+            detail_en=DETAIL_MAP.get(detail_level, 'Basic'),
+        )
+
+    def _compile(self, templates: dict):
+        text_prompts = {
+            key: self._compile_text_prompt(templates, *key)
+            for key in product(STYLE_MAP, DETAIL_MAP, (True, False), TARGET_MODELS, (False, True))
+        }
+        vision_prompts = {target: templates["vision_system"].format(target_model=target) for target in TARGET_MODELS}
+        # 校验用户模板中的占位符
+        templates["vision_user"].format(style_en="", detail_en="", prompt="")
+        return text_prompts, vision_prompts
+
+    def _ensure_compiled(self) -> None:
+        overrides = self._load_overrides()
+        signature = json.dumps(overrides, sort_keys=True, ensure_ascii=False)
+        with self._lock:
+            if signature == self._signature:
+                return
+            templates = self._merge(overrides)
+            try:
+                text_prompts, vision_prompts = self._compile(templates)
+            except (KeyError, IndexError, ValueError) as e:
+                print(f"❌ 自定义模板中存在无效的占位符 {e}，已回退到默认模板。")
+                templates = DEFAULT_TEMPLATES
+                text_prompts, vision_prompts = self._compile(templates)
+            self._templates, self._text_prompts, self._vision_prompts = templates, text_prompts, vision_prompts
+            self._signature = signature
+            token_counts = [estimate_tokens(text) for text in text_prompts.values()]
+            print(f"📝 已预编译 {len(text_prompts)} 个系统提示词模板，"
+                  f"约 {min(token_counts)}~{max(token_counts)} tokens (平均 {sum(token_counts) // len(token_counts)})。")
+
+    def text_system_prompt(self, style: str, detail_level: str, strict_mode: bool, target_model: str,
+                           en_only: bool = False) -> str:
+        self._ensure_compiled()
+        key = (style, detail_level, bool(strict_mode), target_model, bool(en_only))
+        prompt = self._text_prompts.get(key)
+        if prompt is None:
+            # 不在预设选项中的组合(例如旧工作流)按需编译
+            prompt = self._compile_text_prompt(self._templates, *key)
+        return prompt
+
+    def vision_prompts(self, prompt: str, style: str, detail_level: str, strict_mode: bool, target_model: str,
+                       en_only: bool = False):
+        """返回图生文模式的 (系统提示词, 用户提示词)"""
+        self._ensure_compiled()
+        system_prompt = self._vision_prompts.get(target_model) or self._templates["vision_system"].format(target_model=target_model)
+        user_prompt = self._templates["vision_user"].format(
+            style_en=STYLE_MAP.get(style, 'General'), detail_en=DETAIL_MAP.get(detail_level, 'Basic'), prompt=prompt
+        )
+        strict_instruction = self._format_instruction(self._templates, strict_mode, en_only)
+        return system_prompt, f"{user_prompt}\n\n{strict_instruction}"
+
+    def token_report(self) -> dict:
+        """返回每个已编译模板的估算 token 数，便于对比和压缩模板"""
+        self._ensure_compiled()
+        return {key: estimate_tokens(text) for key, text in self._text_prompts.items()}
+
+
+prompt_templates = PromptTemplateRegistry()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import importlib.util
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_plugin(name: str = "ai_prompt_refiner"):
+    """插件目录名可能包含连字符，按文件路径加载为一个包"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(PLUGIN_DIR, "__init__.py"),
+                                                  submodule_search_locations=[PLUGIN_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+load_plugin()
+from ai_prompt_refiner.scheduler import RequestScheduler  # noqa: E402
+
+
+class StubResponse:
+    def __init__(self, status_code: int, retry_after: str = None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_request(*responses):
+    calls = []
+
+    def request():
+        calls.append(time.monotonic())
+        return responses[len(calls) - 1]
+    return request, calls
+
+
+def test_first_request_429_without_limits_only_waits_retry_after():
+    scheduler = RequestScheduler()
+    throttled = StubResponse(429, "0")
+    request, calls = make_request(throttled, StubResponse(200))
+
+    start = time.monotonic()
+    response = scheduler.send("无限速服务", {"name": "无限速服务"}, 100, request)
+
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert throttled.closed
+    assert time.monotonic() - start < 1.0
+    # 只有一次发送记录，不能据此学习速度上限
+    provider = scheduler.queue_for("无限速服务", {"rpm": 0, "tpm": 0, "burst": 0, "retries": 2})
+    assert not provider.limited
+    assert provider.rate_factor == 1.0
+
+    # 后续请求不受影响，立即发送
+    request, calls = make_request(StubResponse(200))
+    start = time.monotonic()
+    scheduler.send("无限速服务", {"name": "无限速服务"}, 100, request)
+    assert time.monotonic() - start < 0.1
+
+
+def test_429_without_retry_after_uses_exponential_backoff():
+    scheduler = RequestScheduler()
+    request, calls = make_request(StubResponse(429), StubResponse(429), StubResponse(200))
+
+    response = scheduler.send("无限速服务", {"name": "无限速服务"}, 0, request)
+
+    assert response.status_code == 200
+    # 第一次暂停 1 秒，第二次暂停 2 秒
+    assert calls[1] - calls[0] >= 0.9
+    assert calls[2] - calls[1] >= 1.9
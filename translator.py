@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
-import requests
 import json
-from typing import Tuple
+import re
+from typing import Tuple, List
 import urllib.parse
 
 # 从共享文件中导入通用配置和函数
-from .common import SERVICE_CONFIG, clean_text, load_preset_configs
+from .common import SERVICE_CONFIG, clean_text, get_preset_names, get_preset, http_post, http_get, estimate_tokens
+from .cache import translation_memory, make_cache_key
+from .routing import is_routing_group, run_routed
+from .async_runtime import run_in_background, select_function
+from .metrics import track_call, stage, current_call, record_usage
+from .singleflight import single_flight
+from .streaming import response_text
 
 class AITranslator:
     """
@@ -13,12 +19,21 @@ class AITranslator:
     """
     
     TRADITIONAL_SERVICES = ["Google Translate", "MyMemory Translate"]
+    GOOGLE_TRANSLATE_URL = "https://translate.googleapis.com/translate_a/single"
+    MYMEMORY_URL = "https://api.mymemory.translated.net/get"
+
+    # 按句子或逗号分隔的标签切分文本；小数点（如权重 1.4）不会被切开
+    SEGMENT_PATTERN = re.compile(r"(\s*[,，、;；。！？!?\n]\s*|\.(?:\s+|$))")
+    # 重新拼接时，将分隔符转换为目标语言的标点
+    SEPARATOR_MAP = {
+        "中文 -> 英文": {"，": ", ", "、": ", ", "；": "; ", "。": ". ", "！": "! ", "？": "? "},
+        "英文 -> 中文": {",": "，", ";": "；", ".": "。", "!": "！", "?": "？"},
+    }
     
     @classmethod
     def INPUT_TYPES(cls):
         # 在需要时才加载配置文件
-        preset_configs = load_preset_configs()
-        preset_names = [config["name"] for config in preset_configs]
+        preset_names = get_preset_names()
 
         # 如果没有AI配置，下拉菜单只显示传统服务
         all_services = cls.TRADITIONAL_SERVICES + preset_names
@@ -31,29 +46,32 @@ class AITranslator:
                 "text_to_translate": ("STRING", {"multiline": True, "default": "", "tooltip": "输入您想要翻译的文本。"}),
                 "translation_direction": (["中文 -> 英文", "英文 -> 中文"], {"default": "中文 -> 英文", "tooltip": "选择翻译方向。"}),
                 "service_selection": (all_services, {"default": "Google Translate", "tooltip": "选择翻译服务或您在config.json中定义的AI配置。"}),
+            },
+            "optional": {
+                "bypass_cache": ("BOOLEAN", {"default": False, "label_on": "跳过翻译记忆", "label_off": "使用翻译记忆", "tooltip": "开启后忽略本地翻译记忆库，整段文本直接发送给翻译服务。"}),
             }
         }
 
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("翻译后的文本",)
-    FUNCTION = "translate"
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("翻译后的文本", "性能指标")
+    # 新版ComfyUI使用异步函数，等待API时不阻塞其他节点
+    FUNCTION = select_function("translate", "translate_async")
+    PREFETCH_FUNCTION = "translate"
     CATEGORY = "AI提示词工具" 
 
     def _get_config_details(self, selection):
-        # 每次都重新加载配置，以反映用户可能在运行时对文件的修改
-        for preset in load_preset_configs():
-            if preset["name"] == selection:
-                print(f"✅ 使用配置文件 '{selection}'")
-                return preset
+        preset = get_preset(selection)
+        if preset is not None:
+            return preset
         
         raise ValueError(f"找不到名为 '{selection}' 的配置。请重启ComfyUI或检查config.json文件。")
 
     def _google_translate(self, text: str, direction: str) -> str:
         source_lang, target_lang = ("zh-CN", "en") if direction == "中文 -> 英文" else ("en", "zh-CN")
-        url = "https://translate.googleapis.com/translate_a/single"
+        url = self.GOOGLE_TRANSLATE_URL
         params = {"client": "gtx", "sl": source_lang, "tl": target_lang, "dt": "t", "q": text}
         print("🚀 正在调用 Google Translate API...")
-        response = requests.get(url, params=params, timeout=20, verify=False)
+        response = http_get(url, {"name": "Google Translate"}, params=params, timeout=20, verify=False)
         response.raise_for_status()
         try:
             return "".join([item[0] for item in response.json()[0] if item[0]])
@@ -63,9 +81,9 @@ class AITranslator:
     def _mymemory_translate(self, text: str, direction: str) -> str:
         source_lang, target_lang = ("zh-CN", "en") if direction == "中文 -> 英文" else ("en", "zh-CN")
         email = "user@example.com"
-        url = f"https://api.mymemory.translated.net/get?q={urllib.parse.quote(text)}&langpair={source_lang}|{target_lang}&de={email}"
+        url = f"{self.MYMEMORY_URL}?q={urllib.parse.quote(text)}&langpair={source_lang}|{target_lang}&de={email}"
         print("🚀 正在调用 MyMemory Translate API...")
-        response = requests.get(url, timeout=20, verify=False)
+        response = http_get(url, {"name": "MyMemory Translate"}, timeout=20, verify=False)
         response.raise_for_status()
         data = response.json()
         if data.get("responseStatus") == 200:
@@ -73,56 +91,159 @@ class AITranslator:
         else:
             raise ValueError(f"MyMemory API 返回错误: {data.get('responseDetails')}")
 
-    def translate(self, text_to_translate: str, translation_direction: str, service_selection: str) -> Tuple[str]:
-        if not text_to_translate.strip():
-            return ("",)
-        try:
-            translated_text = ""
-            if service_selection in self.TRADITIONAL_SERVICES:
-                if service_selection == "Google Translate": 
-                    translated_text = self._google_translate(text_to_translate, translation_direction)
-                elif service_selection == "MyMemory Translate":
-                    translated_text = self._mymemory_translate(text_to_translate, translation_direction)
-            
-            else: # Is an AI Service
-                config = self._get_config_details(service_selection)
-                service_type = config.get("type")
-                final_key = config.get("api_key")
-                api_url = config.get("api_base")
-                model = config.get("model")
-                
-                headers = {"Content-Type": "application/json"}
-                system_prompt = "You are a professional translator. Translate the following Chinese text to English. Only return the translated English text, without any explanations or extra content." if translation_direction == "中文 -> 英文" else "You are a professional translator. Translate the following English text to Chinese. Only return the translated Chinese text, without any explanations or extra content."
-
-                if service_type == "Gemini":
-                    if "key=" not in api_url: api_url = f"{api_url}?key={final_key}"
-                    payload = {"contents": [{"parts": [{"text": f"{system_prompt}\n\n{text_to_translate}"}]}]}
-                else:
-                    headers["Authorization"] = f"Bearer {final_key}"
-                    payload = {"model": model, "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": text_to_translate}]}
+    def _split_segments(self, text: str) -> List[Tuple[str, str]]:
+        """将文本切分为 [(片段, 其后的分隔符), ...]"""
+        parts = self.SEGMENT_PATTERN.split(text)
+        segments = []
+        for i in range(0, len(parts), 2):
+            separator = parts[i + 1] if i + 1 < len(parts) else ""
+            segments.append((parts[i], separator))
+        return segments
+
+    def _normalize_segment(self, segment: str, direction: str) -> str:
+        """翻译记忆库的查找键；英文不区分大小写，但发送给服务的仍是原文"""
+        normalized = " ".join(segment.split())
+        return normalized.lower() if direction == "英文 -> 中文" else normalized
+
+    def _convert_separator(self, separator: str, direction: str) -> str:
+        mark = separator.strip()
+        if not mark:
+            return " " if separator else ""
+        if mark == "\n":
+            return "\n"
+        return self.SEPARATOR_MAP.get(direction, {}).get(mark, separator)
+
+    def _call_ai_service(self, text: str, direction: str, service_selection: str, segment_count: int = 1,
+                         bypass_cache: bool = False) -> str:
+        with stage("config_lookup"):
+            config = self._get_config_details(service_selection)
+        if is_routing_group(config):
+            print(f"🧭 使用路由组 '{service_selection}'。")
+            return run_routed(config, lambda preset: self._call_ai_preset(preset, text, direction, segment_count, bypass_cache))
+        return self._call_ai_preset(config, text, direction, segment_count, bypass_cache)
 
-                print(f"🚀 正在调用 {service_type} API ({api_url}, 模型: {model}) 进行翻译...")
-                response = requests.post(api_url, headers=headers, data=json.dumps(payload), timeout=180)
+    def _call_ai_preset(self, config: dict, text: str, direction: str, segment_count: int = 1,
+                        bypass_cache: bool = False) -> str:
+        service_type = config.get("type")
+        final_key = config.get("api_key")
+        api_url = config.get("api_base")
+        model = config.get("model")
+        
+        headers = {"Content-Type": "application/json"}
+        system_prompt = "You are a professional translator. Translate the following Chinese text to English. Only return the translated English text, without any explanations or extra content." if direction == "中文 -> 英文" else "You are a professional translator. Translate the following English text to Chinese. Only return the translated Chinese text, without any explanations or extra content."
+        if segment_count > 1:
+            system_prompt += f" The input has {segment_count} lines. Translate each line separately and return exactly {segment_count} lines in the same order."
+
+        if service_type == "Gemini":
+            if "key=" not in api_url: api_url = f"{api_url}?key={final_key}"
+            payload = {"contents": [{"parts": [{"text": f"{system_prompt}\n\n{text}"}]}]}
+        else:
+            headers["Authorization"] = f"Bearer {final_key}"
+            payload = {"model": model, "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": text}]}
+
+        call_metrics = current_call()
+        if call_metrics is not None:
+            call_metrics.provider = config.get("name")
+
+        def fetch() -> str:
+            with stage("payload_serialize"):
+                body = json.dumps(payload)
+            print(f"🚀 正在调用 {service_type} API ({api_url}, 模型: {model}) 进行翻译...")
+            with stage("http"):
+                # 译文长度与原文相近，按输入 token 数的两倍估算
+                response = http_post(api_url, config, headers=headers, data=body, tokens=2 * estimate_tokens(text) + estimate_tokens(system_prompt))
                 response.raise_for_status()
-                
+        
+            with stage("response_parse"):
                 try:
                     data = response.json()
-                except requests.exceptions.JSONDecodeError:
+                except ValueError:  # requests 的 JSONDecodeError 是 ValueError 的子类
                     error_text = response.text
                     print(f"❌ 解析JSON失败！服务器返回的不是有效的JSON格式。")
                     print(f"👇 服务器原始响应内容: \n---\n{error_text}\n---")
                     raise ValueError(f"服务器返回内容无法解析，请检查API地址或密钥是否正确。")
+                record_usage(service_type, data)
+
+            return response_text(data, service_type)
+
+        # 跳过缓存时仍合并同时进行的相同请求，但不复用刚完成的结果
+        return single_flight.run(make_cache_key(service_type, config.get("api_base"), payload), fetch, use_memo=not bypass_cache)
+
+    def _translate_with_service(self, text: str, direction: str, service_selection: str, segment_count: int = 1,
+                                bypass_cache: bool = False) -> str:
+        if service_selection in self.TRADITIONAL_SERVICES:
+            translate = self._google_translate if service_selection == "Google Translate" else self._mymemory_translate
+
+            def fetch() -> str:
+                with stage("http"):
+                    return translate(text, direction)
+
+            return single_flight.run(make_cache_key(service_selection, direction, text), fetch, use_memo=not bypass_cache)
+        return self._call_ai_service(text, direction, service_selection, segment_count, bypass_cache)
+
+    def _translate_segments(self, text: str, direction: str, service_selection: str) -> str:
+        """先查翻译记忆库，只把未命中的片段合并成一次请求发送，最后按原顺序拼接"""
+        segments = self._split_segments(text)
+        normalized = [self._normalize_segment(seg, direction) for seg, _ in segments]
+        # 每个查找键对应首次出现的原文片段，人名、缩写等大小写保持不变
+        originals = {}
+        for (seg, _), key in zip(segments, normalized):
+            if key:
+                originals.setdefault(key, " ".join(seg.split()))
+        wanted = list(originals)
+        with stage("memory_lookup"):
+            known = translation_memory.get_many(direction, service_selection, wanted)
+        call_metrics = current_call()
+        if call_metrics is not None:
+            call_metrics.cache = f"{len(known)}/{len(wanted)}"
+
+        missing = [n for n in wanted if n not in known]
+        if missing:
+            print(f"📖 翻译记忆库: {len(wanted) - len(missing)} 个片段命中，{len(missing)} 个片段需要翻译。")
+            batch_result = self._translate_with_service("\n".join(originals[key] for key in missing), direction, service_selection, len(missing))
+            lines = [line.strip() for line in batch_result.strip().split("\n") if line.strip()]
+            if len(lines) != len(missing):
+                # 服务没有按行返回，放弃片段缓存，整段翻译
+                print("⚠️ 翻译结果行数与片段数不一致，改为整段翻译。")
+                return self._translate_with_service(text, direction, service_selection)
+            learned = dict(zip(missing, lines))
+            translation_memory.put_many(direction, service_selection, learned)
+            known.update(learned)
+        else:
+            print(f"📖 翻译记忆库全部命中 ({translation_memory.stats()})，跳过API调用。")
+
+        output = []
+        for (_, separator), key in zip(segments, normalized):
+            if key:
+                output.append(known[key])
+            output.append(self._convert_separator(separator, direction))
+        return "".join(output)
+
+    def translate(self, text_to_translate: str, translation_direction: str, service_selection: str,
+                  bypass_cache: bool = False) -> Tuple[str, str]:
+        if not text_to_translate.strip():
+            return ("", "{}")
+        with track_call("AITranslator", service_selection) as call_metrics:
+            try:
+                if bypass_cache:
+                    call_metrics.cache = "bypass"
+                    translated_text = self._translate_with_service(text_to_translate, translation_direction, service_selection, bypass_cache=True)
+                else:
+                    translated_text = self._translate_segments(text_to_translate, translation_direction, service_selection)
 
-                translated_text = data['candidates'][0]['content']['parts'][0]['text'] if service_type == "Gemini" else data['choices'][0]['message']['content']
+                final_text = clean_text(translated_text)
+                print("✅ 翻译成功。")
+                result = (final_text,)
 
-            final_text = clean_text(translated_text)
-            print("✅ 翻译成功。")
-            return (final_text,)
+            except Exception as e:
+                call_metrics.status = "error"
+                error_msg = f"❌ 翻译失败: {str(e)}"
+                print(error_msg)
+                result = (f"错误: {error_msg}\n\n原文: {text_to_translate}",)
+        return result + (call_metrics.to_json(),)
 
-        except Exception as e:
-            error_msg = f"❌ 翻译失败: {str(e)}"
-            print(error_msg)
-            return (f"错误: {error_msg}\n\n原文: {text_to_translate}",)
+    async def translate_async(self, *args, **kwargs) -> Tuple[str, str]:
+        return await run_in_background(self.translate, *args, **kwargs)
 
 NODE_CLASS_MAPPINGS = { "AITranslator": AITranslator }
 NODE_DISPLAY_NAME_MAPPINGS = { "AITranslator": "AI翻译器" }
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# 共享HTTP连接池: 每个 api_base 主机复用同一个 Session，避免重复的TCP/TLS握手。
+# 本模块只在第一次发送请求时由 common.http_post / http_get 加载。
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .common import get_http_settings
+from .metrics import record_stage, record_http
+from .scheduler import scheduler
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+class _TimedHTTPConnection(HTTPConnection):
+    """记录新建连接(DNS解析 + TCP握手)的耗时"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        record_stage("connect", time.perf_counter() - start)
+        return sock
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """额外记录TLS握手耗时 (connect 总耗时减去 TCP 部分)"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        self._tcp_seconds = time.perf_counter() - start
+        record_stage("connect", self._tcp_seconds)
+        return sock
+
+    def connect(self):
+        self._tcp_seconds = 0.0
+        start = time.perf_counter()
+        super().connect()
+        record_stage("tls", max(0.0, time.perf_counter() - start - self._tcp_seconds))
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+def get_session(url: str, config: dict = None) -> requests.Session:
+    """按主机返回共享的 Session；同一主机的第一个预设决定连接池大小"""
+    parts = urlsplit(url)
+    host_key = f"{parts.scheme}://{parts.netloc}"
+    with _sessions_lock:
+        session = _sessions.get(host_key)
+        if session is None:
+            settings = get_http_settings(config)
+            session = requests.Session()
+            adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=int(settings["pool_size"]))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if not settings["keep_alive"]:
+                session.headers["Connection"] = "close"
+            _sessions[host_key] = session
+        return session
+
+def send(method: str, url: str, config: dict, kwargs: dict) -> requests.Response:
+    if "timeout" not in kwargs:
+        settings = get_http_settings(config)
+        kwargs["timeout"] = (settings["connect_timeout"], settings["read_timeout"])
+    tokens = kwargs.pop("tokens", 0)
+    session = get_session(url, config)
+    # 按预设名称(没有预设时按主机)限速排队，并处理 429 / Retry-After
+    name = (config or {}).get("name") or urlsplit(url).netloc
+    response = scheduler.send(name, config or {"name": name}, tokens, lambda: session.request(method, url, **kwargs))
+    request = response.request
+    body = request.body or b""
+    request_bytes = len(body if isinstance(body, bytes) else body.encode("utf-8"))
+    request_bytes += sum(len(k) + len(v) + 4 for k, v in request.headers.items()) + len(request.method) + len(request.url) + 11
+    # 流式响应的字节数在读取时另行统计
+    response_bytes = 0 if kwargs.get("stream") else len(response.content)
+    record_http(request_bytes, response_bytes, response.elapsed.total_seconds())
+    return response